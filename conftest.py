@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def background_threads_off(settings):
+    """Фоновые потоки выключены, как в ``core.test_runner``."""
+    from core.test_runner import BACKGROUND_OFF
+
+    for name, value in BACKGROUND_OFF.items():
+        setattr(settings, name, value)
@@ -0,0 +1,87 @@
+"""Поля ресурсов API и их чтение через ``.values()``.
+
+Поле ресурса — имя в JSON и выражение для ``.values()``, как в
+``posts.exporting``. Строки читаются без создания моделей, а
+``?fields=`` сужает и список колонок в SELECT. Поля ключа курсора
+читаются всегда и убираются из ответа, если их не просили.
+"""
+from django.conf import settings
+
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+}
+
+GROUP_FIELDS = {
+    'id': 'id',
+    'slug': 'slug',
+    'title': 'title',
+    'description': 'description',
+}
+
+COMMENT_FIELDS = {
+    'id': 'id',
+    'post': 'post_id',
+    'parent': 'parent_id',
+    'author': 'author__username',
+    'text': 'text',
+    'created': 'created',
+}
+
+USER_FIELDS = {
+    'id': 'id',
+    'username': 'username',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+}
+
+
+def _image_url(name):
+    return settings.MEDIA_URL + name if name else None
+
+
+CONVERTERS = {'image': _image_url}
+
+
+class UnknownFields(ValueError):
+    pass
+
+
+def select(fields, requested):
+    """Поля ресурса из параметра ``?fields=a,b`` (все, если не задан)."""
+    if not requested:
+        return dict(fields)
+    names = [name for name in requested.split(',') if name]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise UnknownFields(', '.join(unknown))
+    return {name: fields[name] for name in names}
+
+
+def lookups(fields, *keys):
+    """Выражения для ``.values()`` с обязательными ключами курсора."""
+    return list(dict.fromkeys([*fields.values(), *keys]))
+
+
+def serialize(rows, fields):
+    """Строки ``.values()`` в словари с именами полей ресурса."""
+    result = []
+    for row in rows:
+        record = {}
+        for name, lookup in fields.items():
+            value = row[lookup]
+            if name in CONVERTERS:
+                value = CONVERTERS[name](value)
+            record[name] = value
+        result.append(record)
+    return result
+
+
+def related(fields, prefix):
+    """Те же поля через связь ``prefix``."""
+    return {name: f'{prefix}__{lookup}' for name, lookup in fields.items()}
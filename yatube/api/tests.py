@@ -0,0 +1,111 @@
+from http import HTTPStatus
+
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, text=f'Пост {number}', group=cls.group
+            )
+            for number in range(5)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_list_pages_by_cursor(self):
+        """Курсор next проходит ленту без повторов."""
+        url = reverse('api:post_list') + '?limit=2'
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            seen += [post['id'] for post in data['results']]
+            url = data['next']
+        self.assertEqual(
+            seen, [post.pk for post in reversed(self.posts)]
+        )
+
+    def test_fields_limit_response(self):
+        data = self.client.get(
+            reverse('api:post_list'), {'fields': 'id,author'}
+        ).json()
+        self.assertEqual(
+            data['results'][0],
+            {'id': self.posts[-1].pk, 'author': 'author'},
+        )
+        response = self.client.get(
+            reverse('api:post_list'), {'fields': 'id,password'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_list_is_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('api:post_list'))
+        self.assertEqual(len(queries), 1)
+
+    def test_not_modified_without_queries(self):
+        """Повторный запрос с ETag получает 304 без обращения к базе."""
+        url = reverse('api:post_detail', args=(self.posts[0].pk,))
+        response = self.client.get(url)
+        self.assertEqual(response.json()['comments_count'], 1)
+        self.assertIn('Last-Modified', response)
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(cached.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(len(queries), 0)
+
+        Comment.objects.create(
+            post=self.posts[0], author=self.author, text='Ответ'
+        )
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, HTTPStatus.OK)
+        self.assertEqual(changed.json()['comments_count'], 2)
+
+    def test_comments_groups_and_follows(self):
+        comments = self.client.get(
+            reverse('api:comment_list', args=(self.posts[0].pk,))
+        ).json()
+        self.assertEqual(comments['results'][0]['author'], 'reader')
+        group = self.client.get(
+            reverse('api:group_detail', args=('group',))
+        ).json()
+        self.assertEqual(group['title'], 'Группа')
+        followers = self.client.get(
+            reverse('api:followers', args=('author',))
+        ).json()
+        self.assertEqual(
+            [user['username'] for user in followers['results']], ['reader']
+        )
+        response = self.client.get(reverse('api:following', args=('nobody',)))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_follow_changes_etag(self):
+        url = reverse('api:followers', args=('author',))
+        etag = self.client.get(url)['ETag']
+        Follow.objects.create(
+            user=User.objects.create(username='new'), author=self.author
+        )
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
@@ -0,0 +1,199 @@
+"""JSON API v1: посты, группы, комментарии и подписки только для чтения.
+
+Списки листаются курсором ``?after=`` (``?before=`` — назад) по тому
+же ключу, что и ленты сайта, размер страницы задаёт ``?limit=``.
+ETag и Last-Modified строятся по версиям кеша из ``posts.caching``,
+поэтому ответ 304 не обращается к базе.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_safe
+
+from core.conditional import conditional
+from core.routers import replica_reads
+from posts import caching
+from posts.comments import CommentPaginator
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginators import KeysetPaginator
+
+from . import resources
+
+API_VERSION = 'v1'
+
+
+def _json(data, status=200):
+    # Кириллица без \u-экранирования вдвое короче
+    return JsonResponse(
+        data, status=status, json_dumps_params={'ensure_ascii': False}
+    )
+
+
+def _error(message, status):
+    return _json({'detail': message}, status=status)
+
+
+def api_view(validators):
+    """Только GET и HEAD, чтение с реплик и условный GET."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                return view(request, *args, **kwargs)
+            except resources.UnknownFields as error:
+                return _error(f'Неизвестные поля: {error}', 400)
+            except Http404:
+                return _error('Не найдено', 404)
+        return require_safe(replica_reads(conditional(validators)(wrapper)))
+    return decorator
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        limit = settings.API_PAGE_SIZE
+    return min(max(limit, 1), settings.API_MAX_PAGE_SIZE)
+
+
+def _page_url(request, **cursor):
+    params = request.GET.copy()
+    for param in ('after', 'before', 'page'):
+        params.pop(param, None)
+    params.update(cursor)
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+def _keyset_list(request, queryset, fields, paginator_class=KeysetPaginator):
+    """Страница строк ``.values()`` по курсору (дата, id)."""
+    fields = resources.select(fields, request.GET.get('fields'))
+    date_field = paginator_class.date_field
+    page = paginator_class(
+        queryset.values(*resources.lookups(fields, 'id', date_field)),
+        _limit(request),
+    ).get_page(request.GET)
+    return _json({
+        'results': resources.serialize(page.object_list, fields),
+        'next': page.next_cursor and _page_url(
+            request, after=page.next_cursor
+        ),
+        'previous': page.previous_cursor and _page_url(
+            request, before=page.previous_cursor
+        ),
+    })
+
+
+def _validators(versions):
+    return [API_VERSION, *versions], caching.last_changed(versions)
+
+
+def _feed_versions(request, *args, **kwargs):
+    return _validators([caching.feed_version()])
+
+
+def _post_versions(request, post_id):
+    return _validators([caching.post_versions([post_id])[post_id]])
+
+
+def _follow_versions(request, username):
+    user_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    # Неизвестного пользователя отдаст 404 само представление
+    if user_id is None:
+        return None
+    return _validators([caching.follow_version(user_id)])
+
+
+@api_view(_feed_versions)
+def post_list(request):
+    posts = Post.objects.all()
+    if request.GET.get('group'):
+        posts = posts.filter(group__slug=request.GET['group'])
+    if request.GET.get('author'):
+        posts = posts.filter(author__username=request.GET['author'])
+    return _keyset_list(request, posts, resources.POST_FIELDS)
+
+
+@api_view(_post_versions)
+def post_detail(request, post_id):
+    fields = resources.select(
+        resources.POST_FIELDS, request.GET.get('fields')
+    )
+    rows = Post.objects.filter(pk=post_id).values(*fields.values())
+    if not rows:
+        raise Http404
+    return _json(resources.serialize(rows, fields)[0])
+
+
+@api_view(_post_versions)
+def comment_list(request, post_id):
+    """Все комментарии поста с ответами, от новых к старым."""
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    return _keyset_list(
+        request,
+        Comment.objects.filter(post_id=post_id),
+        resources.COMMENT_FIELDS,
+        CommentPaginator,
+    )
+
+
+@api_view(_feed_versions)
+def group_list(request):
+    fields = resources.select(
+        resources.GROUP_FIELDS, request.GET.get('fields')
+    )
+    rows = Group.objects.order_by('slug').values(*fields.values())
+    return _json({'results': resources.serialize(rows, fields)})
+
+
+@api_view(_feed_versions)
+def group_detail(request, slug):
+    fields = resources.select(
+        resources.GROUP_FIELDS, request.GET.get('fields')
+    )
+    rows = Group.objects.filter(slug=slug).values(*fields.values())
+    if not rows:
+        raise Http404
+    return _json(resources.serialize(rows, fields)[0])
+
+
+def _follow_list(request, username, follows, related):
+    """Страница подписок от новых к старым по курсору id подписки."""
+    fields = resources.select(
+        resources.related(resources.USER_FIELDS, related),
+        request.GET.get('fields'),
+    )
+    follows = follows.order_by('-pk')
+    after = request.GET.get('after', '')
+    if after.isdigit():
+        follows = follows.filter(pk__lt=int(after))
+    limit = _limit(request)
+    rows = list(
+        follows.values(*resources.lookups(fields, 'pk'))[:limit + 1]
+    )
+    if not rows and not User.objects.filter(username=username).exists():
+        raise Http404
+    return _json({
+        'results': resources.serialize(rows[:limit], fields),
+        'next': _page_url(request, after=rows[limit - 1]['pk'])
+        if len(rows) > limit else None,
+    })
+
+
+@api_view(_follow_versions)
+def followers(request, username):
+    return _follow_list(
+        request, username,
+        Follow.objects.filter(author__username=username), 'user',
+    )
+
+
+@api_view(_follow_versions)
+def following(request, username):
+    return _follow_list(
+        request, username,
+        Follow.objects.filter(user__username=username), 'author',
+    )
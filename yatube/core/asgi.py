@@ -0,0 +1,139 @@
+"""ASGI-приложение поверх WSGI-приложения Django 2.2.
+
+В Django 2.2 нет ASGI-обработчика, поэтому обычные запросы
+``WsgiToAsgi`` передаёт WSGI-приложению в пул потоков, а ответ
+отправляет по кускам по мере того, как его отдаёт Django. Асинхронные
+обработчики (события SSE) подключаются по пути через ``router``.
+Тело запроса читается в память целиком.
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _latin1(value):
+    # WSGI передаёт байты строками latin-1 (PEP 3333)
+    return value.decode('latin-1') if isinstance(value, bytes) else value
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': _latin1(scope.get('query_string', b'')),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = _latin1(name).upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = _latin1(value)
+        if name in environ:
+            value = f'{environ[name]},{value}'
+        environ[name] = value
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+class WsgiToAsgi:
+    """Обслуживает HTTP-запросы WSGI-приложением в пуле потоков."""
+
+    def __init__(self, wsgi_application, workers=None):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='wsgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        body = await read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        await loop.run_in_executor(
+            self.executor, self.respond, build_environ(scope, body), send_sync
+        )
+
+    def respond(self, environ, send_sync):
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start['message'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [
+                    (name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers
+                ],
+            }
+
+        result = self.wsgi_application(environ, start_response)
+        try:
+            # Заголовки уходят вместе с первым куском тела
+            for chunk in result:
+                if 'message' in start:
+                    send_sync(start.pop('message'))
+                if chunk:
+                    send_sync({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            if 'message' in start:
+                send_sync(start.pop('message'))
+            send_sync({'type': 'http.response.body', 'body': b''})
+        finally:
+            # close() отправляет request_finished: Django закрывает
+            # устаревшие соединения с базой этого потока
+            if hasattr(result, 'close'):
+                result.close()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def router(routes, fallback):
+    """ASGI-приложение: обработчик по точному пути или ``fallback``."""
+    async def application(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await lifespan(receive, send)
+        elif scope['type'] == 'http':
+            handler = routes.get(scope['path'], fallback)
+            await handler(scope, receive, send)
+        elif scope['type'] == 'websocket':
+            await send({'type': 'websocket.close'})
+    return application
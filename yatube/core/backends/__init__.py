@@ -0,0 +1,6 @@
+"""Бэкенды баз данных с настройками для продакшена.
+
+``sqlite3`` выполняет PRAGMA из ``OPTIONS['pragmas']`` на каждом
+новом соединении, ``postgresql_pool`` берёт соединения из пула
+процесса вместо открытия нового на каждый запрос.
+"""
@@ -0,0 +1,49 @@
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import pool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL с пулом соединений процесса.
+
+    Размер пула задаёт ``OPTIONS['pool']`` (``min`` и ``max``). Закрытие
+    соединения Django возвращает его в пул; незавершённую транзакцию
+    пул откатывает сам. ``CONN_MAX_AGE`` с пулом держат равным 0.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def _pool(self, conn_params):
+        key = tuple(sorted(conn_params.items()))
+        with _pools_lock:
+            if key not in _pools:
+                sizes = self.settings_dict['OPTIONS'].get('pool', {})
+                _pools[key] = pool.ThreadedConnectionPool(
+                    sizes.get('min', 1), sizes.get('max', 10), **conn_params
+                )
+            return _pools[key]
+
+    def get_new_connection(self, conn_params):
+        self._connection_pool = self._pool(conn_params)
+        connection = self._connection_pool.getconn()
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get(
+            'isolation_level', connection.isolation_level
+        )
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self._connection_pool.putconn(
+                    self.connection, close=bool(self.connection.closed)
+                )
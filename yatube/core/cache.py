@@ -0,0 +1,171 @@
+"""Двухуровневый кеш для развёртывания в несколько процессов.
+
+L1 — память процесса с коротким временем жизни, L2 — общий для всех
+воркеров бэкенд из ``CACHES`` (Redis или файловый кеш как его замена
+на одной машине). По каждому префиксу ключа считаются попадания
+в L1, в L2 и промахи; ``LocalCache`` считает их для кеша одного
+процесса. События кеша попадают и в метрики текущего запроса.
+"""
+import threading
+from collections import Counter, defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import metrics
+
+_MISSING = object()
+_stats = defaultdict(Counter)
+_stats_lock = threading.Lock()
+
+
+def key_prefix(key):
+    """Префикс ключа для метрик: до трёх сегментов без последнего."""
+    separator = ':' if ':' in key else '.'
+    parts = key.split(separator)[:-1] or [key]
+    return separator.join(parts[:3])
+
+
+def record(key, event, count=1):
+    with _stats_lock:
+        _stats[key_prefix(key)][event] += count
+    metrics.cache_event(event, count)
+
+
+def stats():
+    """Снимок счётчиков попаданий и промахов по префиксам ключей."""
+    with _stats_lock:
+        return {prefix: dict(events) for prefix, events in _stats.items()}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class LocalCache(LocMemCache):
+    """Кеш процесса со счётчиками попаданий и промахов."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            record(key, 'misses')
+            return default
+        record(key, 'l1_hits')
+        return value
+
+    def get_many(self, keys, version=None):
+        found = super().get_many(keys, version=version)
+        for key in keys:
+            record(key, 'l1_hits' if key in found else 'misses')
+        return found
+
+
+class TwoTierCache(BaseCache):
+    """Кеш процесса перед общим кешем.
+
+    ``LOCATION`` — имя общего кеша в ``CACHES``. Запись идёт в оба
+    уровня, удаление и ``incr`` сбрасывают L1, поэтому устаревшее
+    значение живёт в других процессах не дольше ``L1_TIMEOUT`` секунд.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location
+        self._l1_timeout = options.get('L1_TIMEOUT', 5)
+        self._l1 = LocMemCache(f'two-tier-{location}', {
+            'TIMEOUT': self._l1_timeout,
+            'OPTIONS': {
+                'MAX_ENTRIES': options.get('L1_MAX_ENTRIES', 1000),
+            },
+        })
+
+    @property
+    def _l2(self):
+        return caches[self._shared_alias]
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self._l1_timeout
+        return min(timeout, self._l1_timeout)
+
+    def get(self, key, default=None, version=None):
+        value = self._l1.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            record(key, 'l1_hits')
+            return value
+        value = self._l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            record(key, 'misses')
+            return default
+        record(key, 'l2_hits')
+        self._l1.set(key, value, self._l1_timeout, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = self._l1.get_many(keys, version=version)
+        for key in found:
+            record(key, 'l1_hits')
+        missing = [key for key in keys if key not in found]
+        if missing:
+            shared = self._l2.get_many(missing, version=version)
+            for key in missing:
+                record(key, 'l2_hits' if key in shared else 'misses')
+            if shared:
+                self._l1.set_many(
+                    shared, self._l1_timeout, version=version
+                )
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l2.set(key, value, timeout, version=version)
+        self._l1.set(
+            key, value, self._local_timeout(timeout), version=version
+        )
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._l2.set_many(data, timeout, version=version)
+        self._l1.set_many(
+            data, self._local_timeout(timeout), version=version
+        )
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._l2.add(key, value, timeout, version=version)
+        if added:
+            self._l1.set(
+                key, value, self._local_timeout(timeout), version=version
+            )
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1.touch(key, self._local_timeout(timeout), version=version)
+        return self._l2.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._l1.delete(key, version=version)
+        return self._l2.incr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        return (
+            self._l1.has_key(key, version=version)
+            or self._l2.has_key(key, version=version)
+        )
+
+    def delete(self, key, version=None):
+        self._l1.delete(key, version=version)
+        self._l2.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self._l1.delete_many(keys, version=version)
+        self._l2.delete_many(keys, version=version)
+
+    def clear(self):
+        self._l1.clear()
+        self._l2.clear()
+
+    def close(self, **kwargs):
+        self._l2.close(**kwargs)
@@ -0,0 +1,57 @@
+"""Условный GET: ETag и Last-Modified по дешёвым валидаторам.
+
+Валидаторы представления — версии из кеша и значения, прочитанные
+коротким запросом по индексу. Если клиент прислал те же, ответ 304
+отдаётся без основного чтения из базы и без отрисовки шаблона.
+Ответы, прочитанные с реплики, валидаторов не получают: реплика
+могла отстать от версий в кеше.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .routers import SAFE_METHODS, current_replica
+
+
+def _set_validators(response, etag, last_modified, private):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Браузер переспрашивает сервер перед каждым показом страницы
+    patch_cache_control(response, no_cache=True, private=private or None)
+
+
+def conditional(validators, private=False):
+    """Отвечает 304, если валидаторы страницы не изменились.
+
+    ``validators(request, *args, **kwargs)`` возвращает пару: части
+    ETag и время последнего изменения (или None), — либо None, если
+    страницу нужно просто построить. ``private`` — страница зависит
+    от зрителя и не должна храниться в общих кешах.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            found = None
+            if request.method in SAFE_METHODS:
+                found = validators(request, *args, **kwargs)
+            if found is None:
+                return view(request, *args, **kwargs)
+            parts, changed = found
+            raw = '|'.join([request.get_full_path(), *map(str, parts)])
+            etag = quote_etag(hashlib.md5(raw.encode()).hexdigest())
+            last_modified = int(changed.timestamp()) if changed else None
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is not None:
+                _set_validators(response, etag, last_modified, private)
+                return response
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not current_replica():
+                _set_validators(response, etag, last_modified, private)
+            return response
+        return wrapper
+    return decorator
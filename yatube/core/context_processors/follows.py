@@ -0,0 +1,15 @@
+from django.utils.functional import SimpleLazyObject
+
+from posts import follow_graph
+
+
+def follows(request):
+    """Подписки зрителя для проверки ``author_id in followed_ids``.
+
+    Множество загружается, только если шаблон к нему обратился.
+    """
+    return {
+        'followed_ids': SimpleLazyObject(
+            lambda: follow_graph.followed_for_request(request)
+        ),
+    }
@@ -0,0 +1,231 @@
+"""Метрики запросов в памяти процесса в формате Prometheus.
+
+``MetricsMiddleware`` на каждый запрос считает число SQL-запросов и их
+время, время отрисовки шаблонов, попадания и промахи кеша и размер
+ответа и складывает их в гистограммы по имени URL (``posts:index``).
+Отрисовку шаблонов измеряет бэкенд ``TimedDjangoTemplates``, события
+кеша сообщает ``core.cache``. Каждый процесс хранит свои гистограммы,
+Prometheus собирает их с каждого воркера отдельно.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+_request = threading.local()
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    """Гистограмма с метками по имени представления."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self._sums = defaultdict(float)
+
+    def observe(self, view, value):
+        with self._lock:
+            self._counts[view][bisect_left(self.buckets, value)] += 1
+            self._sums[view] += value
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+            self._sums.clear()
+
+    def exposition(self):
+        lines = [
+            f'# HELP {self.name} {self.help_text}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            rows = sorted(
+                (view, counts[:], self._sums[view])
+                for view, counts in self._counts.items()
+            )
+        for view, counts, total in rows:
+            label = f'view="{view}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    """Счётчик с метками по имени представления."""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = defaultdict(int)
+
+    def inc(self, view, value=1):
+        with self._lock:
+            self._values[view] += value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def exposition(self):
+        lines = [
+            f'# HELP {self.name} {self.help_text}',
+            f'# TYPE {self.name} counter',
+        ]
+        with self._lock:
+            rows = sorted(self._values.items())
+        lines.extend(
+            f'{self.name}{{view="{view}"}} {value}' for view, value in rows
+        )
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    'yatube_request_duration_seconds', 'Время ответа', LATENCY_BUCKETS
+)
+QUERIES = Histogram(
+    'yatube_request_queries', 'SQL-запросов на ответ', QUERY_BUCKETS
+)
+SQL_SECONDS = Histogram(
+    'yatube_request_sql_seconds', 'Время SQL-запросов', LATENCY_BUCKETS
+)
+TEMPLATE_SECONDS = Histogram(
+    'yatube_request_template_seconds',
+    'Время отрисовки шаблонов вместе с запросами из них',
+    LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = Histogram(
+    'yatube_response_bytes', 'Размер ответа', SIZE_BUCKETS
+)
+CACHE_HITS = Counter('yatube_cache_hits_total', 'Попадания в кеш')
+CACHE_MISSES = Counter('yatube_cache_misses_total', 'Промахи кеша')
+
+METRICS = (
+    REQUEST_SECONDS, QUERIES, SQL_SECONDS, TEMPLATE_SECONDS,
+    RESPONSE_BYTES, CACHE_HITS, CACHE_MISSES,
+)
+
+
+def _add(name, value):
+    totals = getattr(_request, 'totals', None)
+    if totals is not None:
+        totals[name] += value
+
+
+def cache_event(event, count=1):
+    """Попадания или промахи кеша в текущем запросе."""
+    _add('cache_misses' if event == 'misses' else 'cache_hits', count)
+
+
+def _timed_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        _add('queries', 1)
+        _add('sql_seconds', time.perf_counter() - started)
+
+
+class TimedTemplate(django_backend.Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            _add('template_seconds', time.perf_counter() - started)
+
+
+class TimedDjangoTemplates(django_backend.DjangoTemplates):
+    """Шаблоны Django с замером времени отрисовки."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self
+            )
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _request.totals = defaultdict(float)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(_timed_query)
+                    )
+                response = self.get_response(request)
+            self.observe(request, response, time.perf_counter() - started)
+        finally:
+            _request.totals = None
+        return response
+
+    def observe(self, request, response, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        totals = _request.totals
+        REQUEST_SECONDS.observe(view, elapsed)
+        QUERIES.observe(view, totals['queries'])
+        SQL_SECONDS.observe(view, totals['sql_seconds'])
+        TEMPLATE_SECONDS.observe(view, totals['template_seconds'])
+        if not response.streaming:
+            RESPONSE_BYTES.observe(view, len(response.content))
+        CACHE_HITS.inc(view, int(totals['cache_hits']))
+        CACHE_MISSES.inc(view, int(totals['cache_misses']))
+
+
+def exposition(cache_stats=None):
+    """Метрики процесса в текстовом формате Prometheus.
+
+    ``cache_stats`` — снимок ``core.cache.stats()``: события кеша
+    по префиксам ключей.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.exposition())
+    if cache_stats:
+        lines += [
+            '# HELP yatube_cache_events_total События кеша по префиксам',
+            '# TYPE yatube_cache_events_total counter',
+        ]
+        for prefix, events in sorted(cache_stats.items()):
+            lines.extend(
+                f'yatube_cache_events_total{{prefix="{prefix}",'
+                f'event="{event}"}} {count}'
+                for event, count in sorted(events.items())
+            )
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    for metric in METRICS:
+        metric.clear()
@@ -0,0 +1,70 @@
+"""Чтение с реплик базы данных.
+
+Реплики читаются только внутри представлений, обёрнутых
+``replica_reads``; остальные запросы и все записи идут в ``default``.
+После записи пользователь на ``REPLICA_LAG`` секунд закрепляется за
+основной базой и сразу видит свои изменения. Данные, прочитанные
+с реплики, не кладутся в долгоживущие кеши.
+"""
+import random
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+PIN_KEY = 'db:pin:{}'
+SAFE_METHODS = ('GET', 'HEAD')
+
+_state = threading.local()
+
+
+def current_replica():
+    """Псевдоним реплики текущего запроса или None."""
+    return getattr(_state, 'replica', None)
+
+
+def pin_to_primary(user):
+    """Закрепляет чтения пользователя за основной базой."""
+    if settings.REPLICA_DATABASES and user.is_authenticated:
+        cache.set(PIN_KEY.format(user.pk), True, settings.REPLICA_LAG)
+
+
+def is_pinned(user):
+    return user.is_authenticated and bool(cache.get(PIN_KEY.format(user.pk)))
+
+
+def replica_reads(view):
+    """Читает данные представления со случайной реплики."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            not settings.REPLICA_DATABASES
+            or request.method not in SAFE_METHODS
+            or is_pinned(request.user)
+        ):
+            return view(request, *args, **kwargs)
+        _state.replica = random.choice(settings.REPLICA_DATABASES)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.replica = None
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return current_replica()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в основной базе
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схему реплики получают вместе с данными от основной базы
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
@@ -0,0 +1,26 @@
+"""Запуск тестов без фоновых потоков.
+
+Потоки миниатюр, рекомендаций и почты работают со своим соединением
+с базой, а таблицы тестовой базы SQLite в памяти блокируются целиком:
+запись из потока ломает запросы теста. Тесты, которым нужен поток,
+включают его сами через ``override_settings``.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+BACKGROUND_OFF = {
+    'THUMBNAIL_WORKERS': 0,
+    'SUGGESTION_WORKERS': 0,
+    'MAIL_WORKER': False,
+}
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._background_off = override_settings(**BACKGROUND_OFF)
+        self._background_off.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._background_off.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,9 +1,251 @@
-from django.test import TestCase
+import asyncio
+import shutil
+import tempfile
+
+from django.core.cache import cache, caches
+from django.db import connection, connections
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from http import HTTPStatus
 
+from core import asgi, cache as two_tier, metrics, routers
+from posts import follow_graph
+from posts.models import Post
+
 
 class ViewTestClass(TestCase):
     def test_error_page(self):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class TwoTierCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.shared_dir = tempfile.mkdtemp()
+        cls.caches_override = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'core.cache.TwoTierCache',
+                'LOCATION': 'shared',
+            },
+            'shared': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': cls.shared_dir,
+            },
+        })
+        cls.caches_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.caches_override.disable()
+        shutil.rmtree(cls.shared_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+        two_tier.reset_stats()
+
+    def test_value_is_read_from_shared_cache_after_local_expiry(self):
+        """Значение из общего кеша попадает в кеш процесса."""
+        self.cache.set('posts:page:index:1', 'page')
+        self.assertEqual(self.cache.get('posts:page:index:1'), 'page')
+        self.cache._l1.clear()
+        self.assertEqual(self.cache.get('posts:page:index:1'), 'page')
+        self.assertIsNone(self.cache.get('posts:page:index:2'))
+        self.assertEqual(
+            two_tier.stats()['posts:page:index'],
+            {'l1_hits': 1, 'l2_hits': 1, 'misses': 1},
+        )
+
+    def test_delete_and_incr_reach_both_tiers(self):
+        self.cache.set('posts:version:feed', 1)
+        self.cache.incr('posts:version:feed')
+        self.assertEqual(caches['shared'].get('posts:version:feed'), 2)
+        self.assertEqual(self.cache.get('posts:version:feed'), 2)
+        self.cache.delete('posts:version:feed')
+        self.assertIsNone(caches['shared'].get('posts:version:feed'))
+        self.assertIsNone(self.cache.get('posts:version:feed'))
+
+    def test_key_prefix(self):
+        self.assertEqual(
+            two_tier.key_prefix('posts:page:index:v:anon:md5'),
+            'posts:page:index',
+        )
+        self.assertEqual(
+            two_tier.key_prefix('template.cache.post_card.md5'),
+            'template.cache.post_card',
+        )
+
+
+class SqliteBackendTest(TestCase):
+    def test_pragmas_are_applied_to_connection(self):
+        """PRAGMA из настроек выполняются на соединении с базой."""
+        pragmas = connection.settings_dict['OPTIONS'].get('pragmas', {})
+        self.assertNotIn('pragmas', connection.get_connection_params())
+        if pragmas.get('synchronous') != 'NORMAL':
+            self.skipTest('WAL отключён переменной окружения')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'], REPLICA_LAG=5)
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='reader')
+        self.view = routers.replica_reads(
+            lambda request: routers.current_replica()
+        )
+        self.router = routers.ReplicaRouter()
+
+    def request(self, method='get', user=None):
+        request = getattr(RequestFactory(), method)('/')
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_reads_go_to_replica_only_inside_marked_views(self):
+        """Реплика читается только внутри replica_reads и только на GET."""
+        self.assertEqual(self.view(self.request()), 'replica_1')
+        self.assertIsNone(self.view(self.request('post')))
+        self.assertIsNone(routers.current_replica())
+        self.assertEqual(self.router.db_for_write(None), 'default')
+
+    def test_user_is_pinned_to_primary_after_write(self):
+        """После записи пользователь читает с основной базы."""
+        self.assertEqual(self.view(self.request(user=self.user)), 'replica_1')
+        routers.pin_to_primary(self.user)
+        self.assertIsNone(self.view(self.request(user=self.user)))
+        self.assertEqual(self.view(self.request()), 'replica_1')
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'], REPLICA_LAG=5)
+class ReplicaDatabaseTest(TransactionTestCase):
+    """Чтения с настоящего второго псевдонима базы."""
+    databases = {'default', 'replica_1'}
+
+    @classmethod
+    def setUpClass(cls):
+        # Реплика — второе соединение с той же тестовой базой
+        connections.databases['replica_1'] = {
+            **connections['default'].settings_dict,
+            'TEST': {'MIRROR': 'default'},
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica_1'].close()
+        del connections.databases['replica_1']
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='reader')
+        self.post = Post.objects.create(author=self.user, text='С реплики')
+
+    def test_marked_views_read_from_replica_alias(self):
+        """Лента читается из реплики и не кладёт в кеш подписки и
+        карточки."""
+        self.client.force_login(self.user)
+        replica = connections['replica_1']
+        with CaptureQueriesContext(replica) as queries:
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, self.post.text)
+        self.assertTrue(queries.captured_queries)
+        self.assertIsNone(
+            response.context['page_obj'][0].cache_version
+        )
+        self.assertIsNone(
+            cache.get(follow_graph.FOLLOWED_KEY.format(self.user.pk))
+        )
+
+    def test_replica_is_not_migrated(self):
+        router = routers.ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica_1', 'posts'))
+        self.assertIsNone(router.allow_migrate('default', 'posts'))
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.staff = get_user_model().objects.create_user(
+            username='admin', is_staff=True
+        )
+
+    def test_request_metrics_are_grouped_by_url_name(self):
+        """Метрики запроса попадают в гистограммы по имени URL."""
+        self.client.get('/')
+        self.client.force_login(self.staff)
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        for line in (
+            'yatube_request_queries_count{view="posts:index"} 1',
+            'yatube_response_bytes_count{view="posts:index"} 1',
+            'yatube_request_template_seconds_bucket{view="posts:index",'
+            'le="+Inf"} 1',
+            'yatube_cache_misses_total{view="posts:index"}',
+        ):
+            self.assertIn(line, text)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_require_staff_or_token(self):
+        """Метрики отдаются только персоналу или по токену."""
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        response = self.client.get(
+            '/metrics/', HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class AsgiAdapterTest(TestCase):
+    def call(self, application, scope, body=b''):
+        messages = [
+            {'type': 'http.request', 'body': body[:2], 'more_body': True},
+            {'type': 'http.request', 'body': body[2:]},
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(application(scope, receive, send))
+        finally:
+            loop.close()
+        return sent
+
+    def test_wsgi_application_is_streamed(self):
+        """Запрос доходит до WSGI-приложения, ответ уходит по кускам."""
+        def wsgi(environ, start_response):
+            start_response('201 Created', [('X-Path', environ['PATH_INFO'])])
+            body = environ['wsgi.input'].read()
+            return [body, environ['HTTP_X_NAME'].encode()]
+
+        application = asgi.router({}, asgi.WsgiToAsgi(wsgi, workers=1))
+        sent = self.call(application, {
+            'type': 'http',
+            'method': 'POST',
+            'path': '/путь/',
+            'query_string': b'',
+            'headers': [(b'x-name', b'yatube')],
+        }, body=b'body')
+        self.assertEqual(sent[0]['status'], 201)
+        self.assertIn((b'x-path', '/путь/'.encode()), sent[0]['headers'])
+        self.assertEqual(
+            [message.get('body') for message in sent[1:]],
+            [b'body', b'yatube', b''],
+        )
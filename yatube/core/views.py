@@ -1,5 +1,12 @@
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
 
+from . import cache, metrics
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию,
@@ -17,3 +24,18 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics_view(request):
+    """Метрики процесса для Prometheus: персоналу или по токену."""
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not (
+        request.user.is_staff
+        or token and hmac.compare_digest(header, f'Bearer {token}')
+    ):
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.exposition(cache.stats()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
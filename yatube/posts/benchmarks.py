@@ -0,0 +1,225 @@
+"""Замеры страниц Yatube на наполненной базе.
+
+Сценарии берут из базы самые тяжёлые объекты: группу с наибольшим
+числом постов, автора с наибольшим числом подписчиков, читателя с
+наибольшим числом подписок и пост с наибольшим числом комментариев.
+Страницы запрашиваются тестовым клиентом в процессе (со счётом
+SQL-запросов) или параллельно по HTTP у запущенного сервера.
+Результаты сравниваются с сохранённой базовой линией.
+"""
+import json
+import threading
+import time
+import urllib.request
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import AuthorStats, Comment, Follow, Post, User
+
+Scenario = namedtuple('Scenario', 'name url user')
+
+# Рост p95, который всегда считается шумом
+SLACK_MS = 20
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def scenarios():
+    """Сценарии для самых нагруженных объектов базы."""
+    found = [Scenario('index', reverse('posts:index'), None)]
+    group = (
+        Post.objects.filter(group__isnull=False)
+        .values('group__slug').annotate(posts=Count('id'))
+        .order_by('-posts').first()
+    )
+    if group:
+        found.append(Scenario('group_list', reverse(
+            'posts:group_list', args=(group['group__slug'],)
+        ), None))
+    popular = AuthorStats.objects.select_related('user').order_by(
+        '-followers_count'
+    ).first()
+    if popular:
+        found.append(Scenario('profile', reverse(
+            'posts:profile', args=(popular.user.username,)
+        ), None))
+    reader = AuthorStats.objects.select_related('user').order_by(
+        '-following_count'
+    ).first()
+    if reader:
+        found.append(Scenario(
+            'follow_index', reverse('posts:follow_index'), reader.user
+        ))
+    viral = Post.objects.order_by('-comments_count').only('pk').first()
+    if viral:
+        found.append(Scenario('post_detail', reverse(
+            'posts:post_detail', args=(viral.pk,)
+        ), None))
+    return found
+
+
+def dataset():
+    """Объём данных, на которых сняты замеры."""
+    return {
+        'users': User.objects.count(),
+        'posts': Post.objects.count(),
+        'comments': Comment.objects.count(),
+        'follows': Follow.objects.count(),
+    }
+
+
+def summarize(latencies, elapsed, queries=None):
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'queries': max(queries) if queries else None,
+    }
+
+
+def _client(user):
+    # Не внутренний адрес: debug_toolbar не включается для клиента
+    client = Client(REMOTE_ADDR='192.0.2.1')
+    if user is not None:
+        client.force_login(user)
+    return client
+
+
+def run_client(scenario, requests, warmup=2, cold=False):
+    """Страница тестовым клиентом: задержки и SQL-запросы на ответ.
+
+    ``cold`` очищает кеш перед каждым запросом, иначе ленты отдаются
+    из кеша страниц, как повторные запросы одной страницы.
+    """
+    client = _client(scenario.user)
+    for _ in range(warmup):
+        client.get(scenario.url)
+    latencies, queries = [], []
+    started = time.perf_counter()
+    for _ in range(requests):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            begin = time.perf_counter()
+            response = client.get(scenario.url)
+            latencies.append(time.perf_counter() - begin)
+        if response.status_code != 200:
+            raise RuntimeError(
+                f'{scenario.url}: ответ {response.status_code}'
+            )
+        queries.append(len(captured.captured_queries))
+    return summarize(latencies, time.perf_counter() - started, queries)
+
+
+def run_http(scenario, base_url, requests, concurrency):
+    """Страница по HTTP из нескольких потоков: задержки и пропускная."""
+    headers = {}
+    if scenario.user is not None:
+        # Сессия пишется в ту же базу, которую читает сервер
+        name = settings.SESSION_COOKIE_NAME
+        session = _client(scenario.user).cookies[name].value
+        headers['Cookie'] = f'{name}={session}'
+    url = base_url.rstrip('/') + scenario.url
+    latencies, errors = [], []
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            begin = time.perf_counter()
+            try:
+                with urllib.request.urlopen(
+                    urllib.request.Request(url, headers=headers)
+                ) as response:
+                    response.read()
+            except OSError as error:
+                with lock:
+                    errors.append(error)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - begin)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, time.perf_counter() - started)
+    result['errors'] = len(errors)
+    return result
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
+
+
+def save_baseline(path, results, params):
+    with open(path, 'w', encoding='utf-8') as target:
+        json.dump(
+            {'params': params, 'scenarios': results},
+            target, ensure_ascii=False, indent=2, sort_keys=True,
+        )
+        target.write('\n')
+
+
+def mismatch(baseline, params):
+    """Условия замера, которые отличаются от базовой линии.
+
+    Замеры в другом режиме или на другом объёме данных несравнимы;
+    пустой список значит, что сравнивать можно.
+    """
+    saved = baseline.get('params', {})
+    return [
+        f'{name}: {saved.get(name)}, сейчас {value}'
+        for name, value in params.items() if saved.get(name) != value
+    ]
+
+
+def regressions(results, baseline, tolerance, slack_ms=SLACK_MS):
+    """Ухудшения относительно базовой линии.
+
+    Задержка p95 может вырасти не больше чем в ``1 + tolerance`` раз
+    или на ``slack_ms`` миллисекунд: у быстрых страниц шум измерения
+    больше допуска. Число SQL-запросов на ответ расти не должно.
+    """
+    found = []
+    for name, result in results.items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        limit = max(
+            base['p95_ms'] * (1 + tolerance), base['p95_ms'] + slack_ms
+        )
+        if result['p95_ms'] > limit:
+            found.append(
+                f'{name}: p95 {result["p95_ms"]} мс, '
+                f'было {base["p95_ms"]} мс'
+            )
+        if None not in (result['queries'], base['queries']) and (
+            result['queries'] > base['queries']
+        ):
+            found.append(
+                f'{name}: {result["queries"]} запросов, '
+                f'было {base["queries"]}'
+            )
+    return found
@@ -0,0 +1,155 @@
+"""Версионированный кеш страниц ленты и карточек постов.
+
+Ключи содержат версию: вместо удаления фрагментов сигналы сбрасывают
+версию, и следующий запрос строит новый ключ. Старые записи
+вытесняются из кеша сами.
+"""
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.routers import current_replica
+
+PAGE_CACHE_TIMEOUT = 60 * 60
+VERSION_TIMEOUT = None
+FEED_VERSION_KEY = 'posts:version:feed'
+POST_VERSION_KEY = 'posts:version:post:{}'
+GROUP_VERSION_KEY = 'posts:version:group:{}'
+FOLLOW_VERSION_KEY = 'posts:version:follow:{}'
+PAGE_KEY = 'posts:page:{name}:{version}:{auth}:{cursor}'
+CURSOR_PARAMS = ('after', 'before', 'page')
+
+
+def _new_version():
+    # Начало версии — время её смены в миллисекундах: по нему
+    # отдаётся Last-Modified
+    return f'{int(time.time() * 1000):x}{uuid.uuid4().hex[:6]}'
+
+
+def version_time(version):
+    """Время смены версии или None для версии другого формата."""
+    try:
+        stamp = int(str(version)[:-6], 16) / 1000
+    except ValueError:
+        return None
+    return datetime.fromtimestamp(stamp, timezone.utc)
+
+
+def feed_version():
+    return cache.get_or_set(FEED_VERSION_KEY, _new_version, VERSION_TIMEOUT)
+
+
+def group_version(group_id):
+    """Версия страниц группы: меняется только при записи в группу."""
+    return cache.get_or_set(
+        GROUP_VERSION_KEY.format(group_id), _new_version, VERSION_TIMEOUT
+    )
+
+
+def last_changed(versions):
+    """Время последней смены версий или None, если оно неизвестно."""
+    times = [version_time(version) for version in versions]
+    if not times or None in times:
+        return None
+    return max(times)
+
+
+def follow_version(user_id):
+    """Версия списков подписчиков и подписок пользователя."""
+    return cache.get_or_set(
+        FOLLOW_VERSION_KEY.format(user_id), _new_version, VERSION_TIMEOUT
+    )
+
+
+def post_versions(pks):
+    """Версии карточек постов одним обращением к кешу."""
+    keys = {POST_VERSION_KEY.format(pk): pk for pk in pks}
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, VERSION_TIMEOUT)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def with_card_versions(page_obj):
+    """Проставляет постам страницы маркер для ключа карточки.
+
+    Пост с реплики мог отстать от версии, поэтому его карточка
+    без маркера и в кеш не кладётся.
+    """
+    versions = {}
+    if not current_replica():
+        versions = post_versions(post.pk for post in page_obj.object_list)
+    for post in page_obj.object_list:
+        post.cache_version = versions.get(post.pk)
+    return page_obj
+
+
+def page_key(request, name, version=None):
+    cursor = '&'.join(
+        f'{param}={request.GET.get(param, "")}' for param in CURSOR_PARAMS
+    )
+    return PAGE_KEY.format(
+        name=name,
+        version=version or feed_version(),
+        auth='auth' if request.user.is_authenticated else 'anon',
+        cursor=hashlib.md5(cursor.encode()).hexdigest(),
+    )
+
+
+def page_timeout():
+    """Страница, прочитанная с реплики, могла отстать от версии в ключе
+    и живёт в кеше не дольше допустимого отставания реплики."""
+    if current_replica():
+        return settings.REPLICA_LAG
+    return PAGE_CACHE_TIMEOUT
+
+
+def _page_from_cache(request, key):
+    # Страница читается из кеша не больше раза за запрос
+    pages = request.__dict__.setdefault('_cached_pages', {})
+    if key not in pages:
+        pages[key] = cache.get(key)
+    return pages[key]
+
+
+def peek_page(request, name, version=None):
+    """Страница ленты из кеша или None, без построения."""
+    return _page_from_cache(request, page_key(request, name, version))
+
+
+def cached_page(request, name, build, version=None):
+    """Страница ленты из кеша или построенная функцией build.
+
+    По умолчанию ключ содержит версию общей ленты.
+    """
+    key = page_key(request, name, version)
+    page_obj = _page_from_cache(request, key)
+    if page_obj is None:
+        page_obj = build()
+        cache.set(key, page_obj, page_timeout())
+        return page_obj
+    return with_card_versions(page_obj)
+
+
+def invalidate_post(pk, group_ids=()):
+    """Сбрасывает карточку поста, страницы ленты и его групп."""
+    keys = [GROUP_VERSION_KEY.format(group_id) for group_id in group_ids]
+    cache.delete_many(keys + [POST_VERSION_KEY.format(pk), FEED_VERSION_KEY])
+
+
+def invalidate_posts(pks, group_ids=()):
+    keys = [POST_VERSION_KEY.format(pk) for pk in pks]
+    keys += [GROUP_VERSION_KEY.format(group_id) for group_id in group_ids]
+    cache.delete_many(keys + [FEED_VERSION_KEY])
+
+
+def invalidate_follows(user_ids):
+    cache.delete_many([
+        FOLLOW_VERSION_KEY.format(user_id) for user_id in user_ids
+    ])
@@ -0,0 +1,124 @@
+"""Отложенная запись комментариев пачками (write-behind).
+
+Комментарии копятся в памяти процесса и пишутся одним ``bulk_create``,
+когда набирается ``COMMENT_BATCH_SIZE`` штук или проходит
+``COMMENT_FLUSH_INTERVAL`` секунд. ``bulk_create`` не отправляет
+сигналы, поэтому счётчики комментариев и версии карточек постов
+обновляются здесь же, один раз на пачку.
+
+Если пачка не записалась, комментарии пишутся по одному через
+``save()``: отбрасываются только строки, которые отвергла база, а при
+сбое самой базы оставшиеся возвращаются в очередь.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, connection, transaction
+
+from . import caching, counters
+from .models import Comment
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = []
+_timer = None
+
+
+def enabled():
+    return settings.COMMENT_BATCH_SIZE > 0
+
+
+def _schedule():
+    global _timer
+    if _timer is None:
+        _timer = threading.Timer(
+            settings.COMMENT_FLUSH_INTERVAL, _flush_in_thread
+        )
+        _timer.daemon = True
+        _timer.start()
+
+
+def _flush_in_thread():
+    try:
+        flush()
+    finally:
+        # У потока таймера своё соединение с базой
+        connection.close()
+
+
+def add(comment):
+    """Ставит комментарий в очередь на запись."""
+    with _lock:
+        _pending.append(comment)
+        full = len(_pending) >= settings.COMMENT_BATCH_SIZE
+        if not full:
+            _schedule()
+    if full:
+        flush()
+
+
+def _requeue(comments):
+    with _lock:
+        _pending[:0] = comments
+        _schedule()
+
+
+def _save_each(batch):
+    """Пишет комментарии по одному, возвращает число записанных."""
+    saved = 0
+    for number, comment in enumerate(batch):
+        try:
+            with transaction.atomic():
+                # Счётчик и версию карточки правят сигналы save()
+                comment.save()
+        except (IntegrityError, DataError):
+            logger.exception(
+                'Комментарий к посту %s отброшен', comment.post_id
+            )
+        except Exception:
+            logger.exception(
+                'Не удалось записать %s комментариев, они возвращены '
+                'в очередь', len(batch) - number,
+            )
+            _requeue(batch[number:])
+            break
+        else:
+            saved += 1
+    return saved
+
+
+def flush():
+    """Пишет накопленные комментарии, возвращает число записанных."""
+    global _timer
+    with _lock:
+        batch = _pending[:]
+        _pending.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not batch:
+        return 0
+    per_post = Counter(comment.post_id for comment in batch)
+    try:
+        with transaction.atomic():
+            Comment.objects.bulk_create(batch)
+            for post_id, count in per_post.items():
+                counters.bump_comments(post_id, count)
+    except Exception:
+        logger.warning(
+            'Пачка из %s комментариев не записалась, пишем по одному',
+            len(batch), exc_info=True,
+        )
+        for comment in batch:
+            # bulk_create мог успеть выставить pk до отката
+            comment.pk = None
+        return _save_each(batch)
+    caching.invalidate_posts(per_post)
+    return len(batch)
+
+
+atexit.register(flush)
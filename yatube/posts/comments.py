@@ -0,0 +1,173 @@
+"""Ветки комментариев с постраничной подгрузкой.
+
+Страница — это корневые комментарии поста, от новых к старым, по
+курсору ``(created, id)``. Первые ``REPLIES_OF_THREAD`` ответов каждой
+ветки страницы читаются одним запросом и раскладываются в дерево
+в памяти; остальные подгружаются по курсору ветки пачками того же
+размера.
+"""
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Comment
+from .paginators import KeysetPaginator, decode_cursor, encode_cursor
+
+
+# Глубже этого уровня ответы на странице не сдвигаются вправо
+MAX_INDENT = 5
+
+
+class CommentPaginator(KeysetPaginator):
+    date_field = 'created'
+
+
+def thread_root(parent):
+    """Корень ветки, в которую попадёт ответ на parent."""
+    return parent.thread_id or parent.pk
+
+
+def _flatten(children, start):
+    # Обход в глубину без рекурсии: ветки бывают очень длинными
+    stack = list(reversed(start))
+    while stack:
+        reply, depth = stack.pop()
+        reply.indent = min(depth, MAX_INDENT)
+        yield reply
+        stack.extend(
+            (child, depth + 1) for child in reversed(children[reply.pk])
+        )
+
+
+def _thread(root_id):
+    return Comment.objects.filter(thread_id=root_id).order_by('created', 'pk')
+
+
+def first_replies(root_ids, limit):
+    """Первые ``limit + 1`` ответов каждой ветки одним запросом.
+
+    По подзапросу с LIMIT на ветку: каждый читает начало ветки
+    по индексу ``(thread, created, id)``. Строк не больше ``limit + 1``
+    на ветку, поэтому порядок наводит вызывающий код в памяти.
+    """
+    return Comment.objects.filter(reduce(or_, (
+        Q(pk__in=_thread(root_id).values('pk')[:limit + 1])
+        for root_id in root_ids
+    ))).select_related('author').order_by()
+
+
+def replies_after(root_id, created, pk):
+    """Ответы ветки после курсора ``(created, id)`` по возрастанию."""
+    return _thread(root_id).filter(
+        Q(created__gt=created) | Q(pk__gt=pk), created__gte=created
+    ).select_related('author')
+
+
+def _next_cursor(replies, limit):
+    if len(replies) > limit:
+        return encode_cursor(replies[limit - 1], 'created')
+    return None
+
+
+def attach_replies(roots, limit=None):
+    """Проставляет корням первые ``thread_replies`` в порядке обхода.
+
+    Если в ветке есть ещё ответы, ``replies_cursor`` — курсор
+    следующей пачки, иначе None.
+    """
+    if not roots:
+        return roots
+    limit = limit or settings.REPLIES_OF_THREAD
+    threads = defaultdict(list)
+    replies = sorted(
+        first_replies([root.pk for root in roots], limit),
+        key=lambda reply: (reply.created, reply.pk),
+    )
+    for reply in replies:
+        threads[reply.thread_id].append(reply)
+    for root in roots:
+        replies = threads[root.pk]
+        root.replies_cursor = _next_cursor(replies, limit)
+        # Родитель ответа старше его, поэтому начало ветки замкнуто:
+        # все родители показанных ответов тоже показаны
+        children = defaultdict(list)
+        for reply in replies[:limit]:
+            children[reply.parent_id].append(reply)
+        root.thread_replies = list(_flatten(
+            children, [(reply, 1) for reply in children[root.pk]]
+        ))
+    return roots
+
+
+def _depths(parent_ids, root_id):
+    """Глубина комментариев ветки, не больше ``MAX_INDENT``.
+
+    Поднимается по родителям не выше ``MAX_INDENT`` уровней:
+    глубже отступ всё равно не растёт.
+    """
+    parents = {}
+    frontier = set(parent_ids) - {root_id}
+    for _ in range(MAX_INDENT):
+        if not frontier:
+            break
+        parents.update(
+            Comment.objects.filter(pk__in=frontier).values_list(
+                'pk', 'parent_id'
+            )
+        )
+        frontier = {
+            parents[pk] for pk in frontier if pk in parents
+        } - parents.keys() - {root_id}
+    depths = {}
+    for pk in parent_ids:
+        depth, current = 0, pk
+        while current != root_id and depth < MAX_INDENT:
+            current = parents.get(current)
+            if current is None:
+                depth = MAX_INDENT
+                break
+            depth += 1
+        depths[pk] = depth
+    return depths
+
+
+def more_replies(root, params):
+    """Следующая пачка ответов ветки и курсор пачки за ней.
+
+    Ответы, чьи родители показаны в прошлых пачках, открывают пачку
+    с отступом по глубине родителя.
+    """
+    cursor = decode_cursor(params.get('after'))
+    if cursor is None:
+        return [], None
+    limit = settings.REPLIES_OF_THREAD
+    replies = list(replies_after(root.pk, *cursor)[:limit + 1])
+    next_cursor = _next_cursor(replies, limit)
+    replies = replies[:limit]
+    loaded = {reply.pk for reply in replies}
+    children = defaultdict(list)
+    start = []
+    for reply in replies:
+        if reply.parent_id in loaded:
+            children[reply.parent_id].append(reply)
+        else:
+            start.append(reply)
+    depths = _depths({reply.parent_id for reply in start}, root.pk)
+    return list(_flatten(
+        children, [(reply, depths[reply.parent_id] + 1) for reply in start]
+    )), next_cursor
+
+
+def page_for(post, params):
+    """Страница корневых комментариев поста вместе с ответами."""
+    roots = Comment.objects.filter(
+        post=post, parent__isnull=True
+    ).select_related('author')
+    page_obj = CommentPaginator(
+        roots, settings.COMMENTS_OF_PAGE
+    ).get_page(params)
+    attach_replies(page_obj.object_list)
+    return page_obj
@@ -0,0 +1,131 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики сдвигаются атомарным ``UPDATE ... SET n = n + 1`` из сигналов
+в той же транзакции, что и сама запись. Расхождения исправляет
+команда ``reconcile_counters``.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AuthorStats, Comment, Follow, Post, TimelineEntry, User
+
+
+def recount(user_id):
+    """Пересчитывает счётчики пользователя по исходным таблицам."""
+    stats, _ = AuthorStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'posts_count': Post.objects.filter(author_id=user_id).count(),
+            'followers_count': Follow.objects.filter(
+                author_id=user_id
+            ).count(),
+            'following_count': Follow.objects.filter(
+                user_id=user_id
+            ).count(),
+            'timeline_length': TimelineEntry.objects.filter(
+                user_id=user_id
+            ).count(),
+        },
+    )
+    return stats
+
+
+def stats_for(user):
+    """Счётчики пользователя, при отсутствии строки считает их."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return recount(user.pk)
+
+
+def _shift(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gt': 0})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def bump(user_id, field, delta):
+    """Сдвигает счётчик пользователя на delta.
+
+    Уменьшение не создаёт строку счётчиков заново: оно приходит и из
+    каскадного удаления пользователя, строка которого уже удалена.
+    Недостающую строку посчитает ``stats_for`` при чтении.
+    """
+    if user_id is None:
+        return
+    stats = AuthorStats.objects.filter(user_id=user_id)
+    if _shift(stats, field, delta) or delta < 0 or stats.exists():
+        return
+    if User.objects.filter(pk=user_id).exists():
+        recount(user_id)
+
+
+def bump_many(user_ids, field, delta):
+    """Сдвигает счётчик сразу нескольких пользователей."""
+    user_ids = set(user_ids)
+    _shift(AuthorStats.objects.filter(user_id__in=user_ids), field, delta)
+    if delta < 0:
+        return
+    known = AuthorStats.objects.filter(
+        user_id__in=user_ids
+    ).values_list('user_id', flat=True)
+    for user_id in user_ids.difference(known):
+        recount(user_id)
+
+
+def bump_comments(post_id, delta):
+    """Сдвигает счётчик комментариев поста на delta."""
+    if post_id is not None:
+        _shift(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def _count(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile(post_ids=None, user_ids=None):
+    """Пересчитывает счётчики несколькими массовыми запросами.
+
+    ``post_ids`` и ``user_ids`` ограничивают пересчёт постами и
+    пользователями; если оба не заданы, пересчитывается всё.
+    """
+    everything = post_ids is None and user_ids is None
+    posts = authors = 0
+    if everything or post_ids is not None:
+        queryset = Post.objects.all()
+        if post_ids is not None:
+            queryset = queryset.filter(pk__in=post_ids)
+        posts = queryset.update(
+            comments_count=_count(Comment.objects.all(), 'post')
+        )
+    if everything or user_ids is not None:
+        users = User.objects.all()
+        stats = AuthorStats.objects.all()
+        if user_ids is not None:
+            users = users.filter(pk__in=user_ids)
+            stats = stats.filter(user_id__in=user_ids)
+        missing = users.filter(stats__isnull=True).values_list(
+            'pk', flat=True
+        )
+        AuthorStats.objects.bulk_create(
+            (AuthorStats(user_id=pk) for pk in missing.iterator()),
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+        authors = stats.update(
+            posts_count=_count(Post.objects.all(), 'author'),
+            followers_count=_count(Follow.objects.all(), 'author'),
+            following_count=_count(Follow.objects.all(), 'user'),
+            timeline_length=_count(TimelineEntry.objects.all(), 'user'),
+        )
+    return posts, authors
@@ -0,0 +1,96 @@
+"""Потоковая выгрузка постов, комментариев и подписок.
+
+Записи читаются из базы через ``.values().iterator()`` кусками
+по ``CHUNK_SIZE`` строк и сразу сериализуются построчно, поэтому
+память не растёт с объёмом выгрузки. Поля совпадают с форматом
+команды ``import_content``, колонка ``kind`` отличает тип записи.
+"""
+import csv
+import json
+
+CHUNK_SIZE = 2000
+
+FIELDS = (
+    'kind', 'id', 'text', 'author', 'user', 'group', 'post', 'parent',
+    'pub_date', 'created', 'image',
+)
+
+
+def _rows(queryset, kind, fields):
+    """Строки queryset с полями, переименованными по словарю fields."""
+    for row in queryset.order_by('pk').values(*fields.values()).iterator(
+        chunk_size=CHUNK_SIZE
+    ):
+        record = {'kind': kind}
+        for name, lookup in fields.items():
+            value = row[lookup]
+            record[name] = (
+                value.isoformat() if hasattr(value, 'isoformat') else value
+            )
+        yield record
+
+
+def post_records(posts):
+    return _rows(posts, 'post', {
+        'id': 'id',
+        'text': 'text',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'pub_date': 'pub_date',
+        'image': 'image',
+    })
+
+
+def comment_records(comments):
+    return _rows(comments, 'comment', {
+        'id': 'id',
+        'text': 'text',
+        'author': 'author__username',
+        'post': 'post_id',
+        # Выгрузка идёт по pk, поэтому родитель всегда раньше ответа
+        'parent': 'parent_id',
+        'created': 'created',
+    })
+
+
+def follow_records(follows):
+    return _rows(follows, 'follow', {
+        'user': 'user__username',
+        'author': 'author__username',
+    })
+
+
+def user_records(user):
+    """Посты, комментарии и подписки пользователя."""
+    yield from post_records(user.posts.all())
+    yield from comment_records(user.comments.all())
+    yield from follow_records(user.follower.all())
+
+
+def group_records(group):
+    yield from post_records(group.posts.all())
+
+
+def to_jsonl(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """Файл для csv.writer, который возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def to_csv(records):
+    writer = csv.DictWriter(_Echo(), fieldnames=FIELDS)
+    yield writer.writerow(dict(zip(FIELDS, FIELDS)))
+    for record in records:
+        yield writer.writerow(record)
+
+
+SERIALIZERS = {
+    'jsonl': (to_jsonl, 'application/x-ndjson'),
+    'csv': (to_csv, 'text/csv'),
+}
@@ -0,0 +1,199 @@
+"""Граф подписок: массовые подписки, списки и рекомендации.
+
+Массовая подписка пишется одним ``bulk_create``; ленты и счётчики
+обновляются здесь же, потому что сигналы при этом не отправляются.
+Рекомендации «друзья друзей» считает команда
+``compute_suggestions`` и пишет в таблицу ``Suggestions``, общую для
+всех процессов. Внутри запроса они не считаются: после подписки или
+для ещё не посчитанного пользователя пересчёт ставится в фоновый
+поток, а до его готовности показываются прежние рекомендации или
+пустой список.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+
+from core.routers import current_replica
+
+from . import caching, counters, timeline
+from .models import Follow, Suggestions
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+FOLLOWED_KEY = 'follow:ids:{}'
+FOLLOWED_TIMEOUT = 60 * 60
+SUGGESTIONS_LIMIT = 10
+REFRESH_KEY = 'follow:suggestions:refresh:{}'
+REFRESH_TIMEOUT = 60
+
+
+def follow_many(user, author_ids):
+    """Подписывает пользователя на авторов, возвращает число новых."""
+    author_ids = set(author_ids) - {user.pk}
+    if not author_ids:
+        return 0
+    with transaction.atomic():
+        # Блокировка строки пользователя выстраивает его подписки
+        # в очередь: между двумя запросами ниже чужих вставок нет
+        list(User.objects.select_for_update().filter(pk=user.pk).values('pk'))
+        follows = Follow.objects.filter(user=user, author_id__in=author_ids)
+        existing = set(follows.values_list('author_id', flat=True))
+        if existing == author_ids:
+            return 0
+        Follow.objects.bulk_create(
+            [
+                Follow(user=user, author_id=author_id)
+                for author_id in sorted(author_ids - existing)
+            ],
+            ignore_conflicts=True,
+        )
+        # Счётчики сдвигаются только на действительно вставленные строки
+        new_ids = sorted(
+            set(follows.values_list('author_id', flat=True)) - existing
+        )
+        for author_id in new_ids:
+            timeline.backfill(user.pk, author_id)
+        counters.bump(user.pk, 'following_count', len(new_ids))
+        counters.bump_many(new_ids, 'followers_count', 1)
+        refresh_suggestions(user.pk)
+    invalidate_followed(user.pk)
+    caching.invalidate_follows([user.pk, *new_ids])
+    return len(new_ids)
+
+
+def unfollow_many(user, author_ids):
+    """Отписывает от авторов; ленты и счётчики правят сигналы."""
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(
+            user=user, author_id__in=list(author_ids)
+        ).delete()
+        refresh_suggestions(user.pk)
+    return deleted
+
+
+def followed_ids(user):
+    """Множество id авторов, на которых подписан пользователь."""
+    if not user.is_authenticated:
+        return frozenset()
+    key = FOLLOWED_KEY.format(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(
+            Follow.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )
+        )
+        # Подписки с реплики могут отставать: в кеш на час не кладутся
+        if not current_replica():
+            cache.set(key, ids, FOLLOWED_TIMEOUT)
+    return ids
+
+
+def followed_for_request(request):
+    """Подписки зрителя, загруженные не больше раза за запрос."""
+    if not hasattr(request, '_followed_ids'):
+        request._followed_ids = followed_ids(request.user)
+    return request._followed_ids
+
+
+def invalidate_followed(user_id):
+    cache.delete(FOLLOWED_KEY.format(user_id))
+
+
+def _page(follows, related, after, limit):
+    follows = follows.select_related(related).order_by('-pk')
+    if after:
+        follows = follows.filter(pk__lt=after)
+    rows = list(follows[:limit + 1])
+    next_cursor = rows[limit - 1].pk if len(rows) > limit else None
+    return [getattr(row, related) for row in rows[:limit]], next_cursor
+
+
+def followers(user, after=None, limit=50):
+    """Подписчики от новых к старым и курсор следующей страницы."""
+    return _page(Follow.objects.filter(author=user), 'user', after, limit)
+
+
+def following(user, after=None, limit=50):
+    """Авторы подписок от новых к старым и курсор следующей страницы."""
+    return _page(Follow.objects.filter(user=user), 'author', after, limit)
+
+
+def compute_suggestions(user_id, limit=SUGGESTIONS_LIMIT):
+    """Авторы, на которых подписаны авторы подписок пользователя.
+
+    Чем больше подписок пользователя читают автора, тем он выше.
+    """
+    followed = Follow.objects.filter(user_id=user_id).values('author_id')
+    return list(
+        Follow.objects.filter(user_id__in=followed)
+        .exclude(author_id__in=followed)
+        .exclude(author_id=user_id)
+        .values('author_id', 'author__username')
+        .annotate(score=Count('id'))
+        .order_by('-score', 'author_id')
+        .values_list('author__username', flat=True)[:limit]
+    )
+
+
+def store_suggestions(user_id, usernames):
+    Suggestions.objects.update_or_create(
+        user_id=user_id, defaults={'usernames': ' '.join(usernames)}
+    )
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.SUGGESTION_WORKERS,
+            thread_name_prefix='suggestions',
+        )
+    return _executor
+
+
+def _refresh_in_worker(user_id):
+    try:
+        store_suggestions(user_id, compute_suggestions(user_id))
+    except Exception:
+        logger.exception('Не удалось посчитать рекомендации для %s', user_id)
+    finally:
+        cache.delete(REFRESH_KEY.format(user_id))
+        # У каждого потока пула своё соединение с базой
+        connection.close()
+
+
+def _submit(user_id):
+    if not settings.SUGGESTION_WORKERS:
+        return
+    if cache.add(REFRESH_KEY.format(user_id), True, REFRESH_TIMEOUT):
+        _get_executor().submit(_refresh_in_worker, user_id)
+
+
+def refresh_suggestions(user_id):
+    """Ставит пересчёт рекомендаций в пул после фиксации транзакции."""
+    transaction.on_commit(lambda: _submit(user_id))
+
+
+def suggestions(user):
+    """Имена рекомендованных авторов из таблицы ``Suggestions``.
+
+    Если пакетная задача ещё не посчитала пользователя, пересчёт
+    ставится в пул, а страница пока обходится без рекомендаций.
+    """
+    usernames = Suggestions.objects.filter(user_id=user.pk).values_list(
+        'usernames', flat=True
+    ).first()
+    if usernames is None:
+        refresh_suggestions(user.pk)
+        return []
+    return usernames.split()
@@ -0,0 +1,272 @@
+"""Полнотекстовый поиск по постам.
+
+Текст поста приводится к основам слов (стеммер Портера для русского
+языка) и хранится в инвертированном индексе движка базы: виртуальная
+таблица FTS5 в SQLite, GIN-индекс по ``to_tsvector`` в PostgreSQL.
+Для прочих движков есть запасной поиск без индекса. Таблицу и индекс
+создаёт миграция ``0009_post_search_index``. Таблицу FTS5 заполняет
+команда ``rebuild_search_index``; пока таблица пуста, поиск идёт без
+индекса. Бэкенд работает с соединением псевдонима базы, переданного
+в ``get_backend``.
+"""
+import re
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+PG_CONFIG = 'russian'
+BATCH_SIZE = 500
+# Строк в одном INSERT: два параметра на строку, в старых SQLite
+# не больше 999 параметров на запрос
+INSERT_BATCH = 400
+
+# Псевдонимы баз, где таблица FTS5 уже не пуста
+_filled = set()
+
+WORD = re.compile(r'\w+')
+
+_VOWELS = 'аеиоуыэюя'
+_PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+)
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых'
+    r'|ую|юю|ая|яя|ою|ею)$'
+)
+_PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло'
+    r'|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем'
+    r'|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_RV = re.compile(rf'^(.*?[{_VOWELS}])(.*)$')
+_DERIVATIONAL = re.compile(rf'.*[^{_VOWELS}]+[{_VOWELS}].*ость?$')
+
+
+def stem(word):
+    """Основа слова по алгоритму Портера для русского языка."""
+    word = word.lower().replace('ё', 'е')
+    match = _RV.match(word)
+    if match is None:
+        return word
+    prefix, rv = match.groups()
+    temp = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if temp != rv:
+        rv = temp
+    else:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        temp = _ADJECTIVE.sub('', rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE.sub('', temp, 1)
+        else:
+            temp = _VERB.sub('', rv, 1)
+            rv = _NOUN.sub('', rv, 1) if temp == rv else temp
+    rv = re.sub('и$', '', rv, 1)
+    if _DERIVATIONAL.match(rv):
+        rv = re.sub('ость?$', '', rv, 1)
+    temp = re.sub('ь$', '', rv, 1)
+    if temp != rv:
+        rv = temp
+    else:
+        rv = re.sub('ейше?$', '', rv, 1)
+        rv = re.sub('нн$', 'н', rv, 1)
+    return prefix + rv
+
+
+def terms(text):
+    """Основы слов текста в порядке следования."""
+    return [stem(word) for word in WORD.findall(text or '')]
+
+
+class SearchBackend:
+    """Поиск без индекса: подходит для любого движка базы."""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self.connection = connections[using]
+
+    def index(self, posts):
+        pass
+
+    def remove(self, pks):
+        pass
+
+    def clear(self):
+        pass
+
+    def filter(self, queryset, query):
+        """Ограничивает queryset постами, подходящими под запрос."""
+        words = WORD.findall(query)
+        if not words:
+            return queryset.none()
+        for word in words:
+            queryset = queryset.filter(text__icontains=stem(word))
+        return queryset
+
+    def ranked_ids(self, query, limit):
+        """id подходящих постов от более релевантных к менее."""
+        return list(self.filter(
+            Post.objects.using(self.using).order_by('-pub_date', '-pk'),
+            query,
+        ).values_list('pk', flat=True)[:limit])
+
+    def rebuild(self, posts):
+        """Переиндексирует посты с пустого индекса, возвращает их число."""
+        self.clear()
+        return self.reindex(posts)
+
+    def reindex(self, posts):
+        """Индексирует посты заново пачками, возвращает их число."""
+        total = 0
+        batch = []
+        for post in posts.only('pk', 'text').iterator():
+            batch.append(post)
+            if len(batch) == BATCH_SIZE:
+                self.index(batch)
+                total += len(batch)
+                batch = []
+        self.index(batch)
+        return total + len(batch)
+
+
+class SqliteSearchBackend(SearchBackend):
+    """Инвертированный индекс FTS5, rowid строки равен id поста."""
+
+    def is_empty(self):
+        """Пуста ли таблица: после миграции её ещё не заполнили."""
+        if self.using in _filled:
+            return False
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'SELECT 1 FROM {FTS_TABLE} LIMIT 1')
+            empty = cursor.fetchone() is None
+        if not empty:
+            _filled.add(self.using)
+        return empty
+
+    def index(self, posts):
+        posts = list(posts)
+        if not posts:
+            return
+        self.remove(post.pk for post in posts)
+        # Одна вставка на пачку вместо executemany: его не умеет
+        # записывать панель SQL в debug_toolbar
+        with self.connection.cursor() as cursor:
+            for start in range(0, len(posts), INSERT_BATCH):
+                batch = posts[start:start + INSERT_BATCH]
+                params = []
+                for post in batch:
+                    params += [post.pk, ' '.join(terms(post.text))]
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE} (rowid, body) VALUES '
+                    + ', '.join(['(%s, %s)'] * len(batch)),
+                    params,
+                )
+
+    def remove(self, pks):
+        pks = list(pks)
+        if not pks:
+            return
+        placeholders = ', '.join(['%s'] * len(pks))
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                pks,
+            )
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        _filled.discard(self.using)
+
+    @staticmethod
+    def match_expression(query):
+        # Каждая основа ищется как префикс, все слова обязательны
+        return ' '.join(f'"{term}"*' for term in terms(query))
+
+    def filter(self, queryset, query):
+        if self.is_empty():
+            return super().filter(queryset, query)
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+        return queryset.extra(
+            where=[
+                f'{Post._meta.db_table}.id IN (SELECT rowid FROM '
+                f'{FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)'
+            ],
+            params=[expression],
+        )
+
+    def ranked_ids(self, query, limit):
+        if self.is_empty():
+            return super().ranked_ids(query, limit)
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                'ORDER BY rank, rowid DESC LIMIT %s',
+                [expression, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Функциональный GIN-индекс, стемминг делает словарь russian."""
+
+    def _search(self, queryset, query):
+        from django.contrib.postgres.search import (
+            SearchQuery, SearchRank, SearchVector
+        )
+        vector = SearchVector('text', config=PG_CONFIG)
+        search_query = SearchQuery(query, config=PG_CONFIG)
+        return queryset.annotate(
+            search=vector, rank=SearchRank(vector, search_query)
+        ).filter(search=search_query)
+
+    def filter(self, queryset, query):
+        return self._search(queryset, query)
+
+    def ranked_ids(self, query, limit):
+        return list(self._search(
+            Post.objects.using(self.using), query
+        ).order_by(
+            '-rank', '-pk'
+        ).values_list('pk', flat=True)[:limit])
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using=DEFAULT_DB_ALIAS):
+    """Бэкенд поиска для движка базы псевдонима ``using``."""
+    backend = BACKENDS.get(connections[using].vendor, SearchBackend)
+    return backend(using)
+
+
+def ranked_page(query, number, per_page):
+    """Страница результатов, упорядоченных по релевантности.
+
+    Ранжируются не больше ``SEARCH_MAX_RESULTS`` постов, поэтому число
+    страниц известно без COUNT(*) по таблице постов.
+    """
+    ids = get_backend().ranked_ids(query, settings.SEARCH_MAX_RESULTS)
+    page_obj = Paginator(ids, per_page).get_page(number)
+    posts = Post.objects.for_feed().in_bulk(page_obj.object_list)
+    page_obj.object_list = [
+        posts[pk] for pk in page_obj.object_list if pk in posts
+    ]
+    return page_obj
@@ -0,0 +1,485 @@
+"""Потоковый импорт постов, комментариев и подписок.
+
+Записи читаются из JSONL или CSV генераторами и пишутся пачками
+через ``bulk_create``. Авторы и группы ищутся по словарям, которые
+дозаполняются одним запросом на пачку. После каждой транзакции
+в файл контрольной точки пишется число обработанных записей, и
+прерванный импорт продолжается с того же места.
+
+Записи вставляются без сигналов, поэтому ленты подписок, счётчики и
+поисковый индекс затронутых импортом авторов, читателей и постов
+пересобираются после него (``rebuild_affected``).
+"""
+import csv
+import json
+import os
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from django.db.models import AutoField
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, fulltext, timeline
+from .models import Comment, Follow, Group, Post, User
+
+# id в одном запросе пересборки производных данных
+AFFECTED_BATCH = 500
+
+
+class RecordError(ValueError):
+    """Запись нельзя импортировать."""
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as source:
+        for line in source:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as source:
+        yield from csv.DictReader(source)
+
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+
+
+def read_records(path, file_format=None):
+    """Записи файла; формат по умолчанию берётся из расширения."""
+    if file_format is None:
+        file_format = os.path.splitext(path)[1].lstrip('.').lower()
+    if file_format == 'json':
+        file_format = 'jsonl'
+    try:
+        reader = READERS[file_format]
+    except KeyError:
+        raise RecordError(f'Неизвестный формат файла: {file_format}')
+    return reader(path)
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class LookupMap:
+    """Словарь ключ → id, недостающие ключи догружаются пачкой."""
+
+    def __init__(self, queryset, field):
+        self.queryset = queryset
+        self.field = field
+        self.ids = {}
+
+    def load(self, keys):
+        missing = {key for key in keys if key and key not in self.ids}
+        if missing:
+            self.ids.update(
+                self.queryset.filter(**{f'{self.field}__in': missing})
+                .values_list(self.field, 'pk')
+            )
+
+    def get(self, key, required=True):
+        if not key:
+            if required:
+                raise RecordError('Не указано обязательное поле')
+            return None
+        try:
+            return self.ids[key]
+        except KeyError:
+            raise RecordError(f'Не найдено: {key}')
+
+
+def _int(value, strict=True):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        if strict:
+            raise RecordError(f'Некорректный id: {value}')
+        return None
+
+
+def _date(value):
+    if not value:
+        return None
+    date = parse_datetime(value)
+    if date is None:
+        raise RecordError(f'Некорректная дата: {value}')
+    return date
+
+
+class Affected:
+    """id, чьи ленты, счётчики и индекс устарели после импорта.
+
+    Вместе с контрольной точкой id пишутся в файл ``<точка>.affected``:
+    продолженный импорт пересобирает и то, что вставил прерванный.
+    """
+    FIELDS = ('authors', 'posts', 'readers', 'followed')
+
+    def __init__(self):
+        # Авторы новых постов: их счётчики, индекс и ленты подписчиков
+        self.authors = set()
+        # Посты новых комментариев: число комментариев
+        self.posts = set()
+        # Стороны новых подписок: счётчики, ленты читателей
+        self.readers = set()
+        self.followed = set()
+
+    @staticmethod
+    def path(checkpoint):
+        return f'{checkpoint}.affected'
+
+    def load(self, checkpoint):
+        try:
+            with open(self.path(checkpoint), encoding='utf-8') as source:
+                saved = json.load(source)
+        except FileNotFoundError:
+            return
+        for field in self.FIELDS:
+            getattr(self, field).update(saved.get(field, ()))
+
+    def save(self, checkpoint):
+        path = self.path(checkpoint)
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as target:
+            json.dump(
+                {field: sorted(getattr(self, field)) for field in self.FIELDS},
+                target,
+            )
+        os.replace(temporary, path)
+
+    def forget(self, checkpoint):
+        """Удаляет файл id после пересборки производных данных."""
+        try:
+            os.remove(self.path(checkpoint))
+        except FileNotFoundError:
+            pass
+
+
+class Importer:
+    """Превращает записи одной модели в объекты для вставки."""
+    model = None
+    date_field = None
+    ignore_conflicts = False
+
+    def __init__(self):
+        self.users = LookupMap(User.objects.all(), 'username')
+
+    def prepare(self, records):
+        """Загружает связанные объекты, нужные пачке записей."""
+
+    def build(self, record):
+        raise NotImplementedError
+
+    def new_only(self, objects):
+        """Объекты пачки, которых ещё нет в базе."""
+        return objects
+
+    def collect(self, objects, affected):
+        """Отмечает в ``affected`` то, что затронули вставленные объекты."""
+
+    def _dated(self, obj, record):
+        date = _date(record.get(self.date_field)) or timezone.now()
+        setattr(obj, self.date_field, date)
+        return obj
+
+
+class PostImporter(Importer):
+    model = Post
+    date_field = 'pub_date'
+
+    def __init__(self):
+        super().__init__()
+        self.groups = LookupMap(Group.objects.all(), 'slug')
+
+    def prepare(self, records):
+        self.users.load(record.get('author') for record in records)
+        self.groups.load(record.get('group') for record in records)
+
+    def build(self, record):
+        if not record.get('text'):
+            raise RecordError('Пустой текст поста')
+        return self._dated(Post(
+            id=_int(record.get('id')),
+            text=record['text'],
+            author_id=self.users.get(record.get('author')),
+            group_id=self.groups.get(record.get('group'), required=False),
+            image=record.get('image') or '',
+        ), record)
+
+    def collect(self, objects, affected):
+        affected.authors.update(post.author_id for post in objects)
+
+
+class CommentImporter(Importer):
+    model = Comment
+    date_field = 'created'
+
+    def __init__(self):
+        super().__init__()
+        self.posts = LookupMap(Post.objects.all(), 'pk')
+        # id комментария → id корня его ветки. Родитель должен быть
+        # в базе или раньше ответа в файле
+        self.threads = {}
+
+    def prepare(self, records):
+        self.users.load(record.get('author') for record in records)
+        self.posts.load(
+            _int(record.get('post'), strict=False) for record in records
+        )
+        parents = {
+            _int(record.get('parent'), strict=False) for record in records
+        } - {None} - set(self.threads)
+        if parents:
+            self.threads.update(
+                (pk, thread_id or pk)
+                for pk, thread_id in Comment.objects.filter(
+                    pk__in=parents
+                ).values_list('pk', 'thread_id')
+            )
+
+    def build(self, record):
+        if not record.get('text'):
+            raise RecordError('Пустой текст комментария')
+        comment = self._dated(Comment(
+            id=_int(record.get('id')),
+            text=record['text'],
+            post_id=self.posts.get(_int(record.get('post'))),
+            author_id=self.users.get(record.get('author')),
+            parent_id=_int(record.get('parent')),
+        ), record)
+        if comment.parent_id is not None:
+            try:
+                comment.thread_id = self.threads[comment.parent_id]
+            except KeyError:
+                raise RecordError(
+                    f'Не найден родительский комментарий: {comment.parent_id}'
+                )
+        if comment.id is not None:
+            self.threads[comment.id] = comment.thread_id or comment.id
+        return comment
+
+    def collect(self, objects, affected):
+        affected.posts.update(comment.post_id for comment in objects)
+
+
+class FollowImporter(Importer):
+    model = Follow
+    ignore_conflicts = True
+
+    def prepare(self, records):
+        self.users.load(
+            name for record in records
+            for name in (record.get('user'), record.get('author'))
+        )
+
+    def build(self, record):
+        user_id = self.users.get(record.get('user'))
+        author_id = self.users.get(record.get('author'))
+        if user_id == author_id:
+            raise RecordError('Нельзя подписаться на себя')
+        return Follow(user_id=user_id, author_id=author_id)
+
+    def new_only(self, objects):
+        # Уже существующие и повторные подписки не вставляются и не
+        # считаются созданными
+        seen = set(Follow.objects.filter(
+            user_id__in={follow.user_id for follow in objects},
+            author_id__in={follow.author_id for follow in objects},
+        ).values_list('user_id', 'author_id'))
+        new = []
+        for follow in objects:
+            pair = (follow.user_id, follow.author_id)
+            if pair not in seen:
+                seen.add(pair)
+                new.append(follow)
+        return new
+
+    def collect(self, objects, affected):
+        affected.readers.update(follow.user_id for follow in objects)
+        affected.followed.update(follow.author_id for follow in objects)
+
+
+IMPORTERS = {
+    'post': PostImporter,
+    'comment': CommentImporter,
+    'follow': FollowImporter,
+}
+
+
+def read_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as source:
+            return int(source.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, done):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as target:
+        target.write(str(done))
+    os.replace(temporary, path)
+
+
+def insert_batch_size(model, batch_size):
+    """Пачка не больше той, что движок базы примет одним INSERT.
+
+    Django 2.2 не ограничивает явный batch_size, а SQLite принимает
+    не больше 999 параметров и 500 строк в одном запросе.
+    """
+    fields = model._meta.concrete_fields
+    limit = connection.ops.bulk_batch_size(fields, [None] * batch_size)
+    return max(min(batch_size, limit), 1)
+
+
+def insert_as_is(model, objects, batch_size, ignore_conflicts=False):
+    """Вставляет объекты пачками со значениями полей как есть.
+
+    В отличие от ``bulk_create`` поля не вызывают ``pre_save``, как
+    при ``loaddata``: ``auto_now_add`` не затирает даты из файла.
+    Объекты с явным id и без него пишутся отдельными INSERT.
+    """
+    fields = model._meta.concrete_fields
+    with_pk = [obj for obj in objects if obj.pk is not None]
+    without_pk = [obj for obj in objects if obj.pk is None]
+    for group, group_fields in (
+        (with_pk, fields),
+        (without_pk, [f for f in fields if not isinstance(f, AutoField)]),
+    ):
+        for batch in chunks(group, batch_size):
+            model._base_manager._insert(
+                batch, fields=group_fields, raw=True,
+                ignore_conflicts=ignore_conflicts,
+            )
+
+
+def reset_sequence(model):
+    """Сдвигает последовательность id после вставки явных id."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def _build(importer, kind, chunk, first, batch_size):
+    """Объекты записей транзакции с номерами записей и число ошибок."""
+    numbered = []
+    errors = 0
+    for start in range(0, len(chunk), batch_size):
+        batch = chunk[start:start + batch_size]
+        importer.prepare(batch)
+        for number, record in enumerate(batch, first + start):
+            # Выгрузка export_content смешивает типы записей
+            if record.get('kind') not in (None, '', kind):
+                continue
+            try:
+                numbered.append((number, importer.build(record)))
+            except RecordError:
+                errors += 1
+    return numbered, errors
+
+
+def _insert(importer, batch, insert_size, report):
+    """Вставляет пачку в точке сохранения, возвращает вставленные.
+
+    Пачку, которую отвергла база, описывает ``report``; тогда
+    возвращается None.
+    """
+    try:
+        with transaction.atomic():
+            objects = importer.new_only([obj for _, obj in batch])
+            insert_as_is(
+                importer.model, objects, insert_size,
+                ignore_conflicts=importer.ignore_conflicts,
+            )
+    except IntegrityError as error:
+        if report is not None:
+            report(
+                f'Записи {batch[0][0]}–{batch[-1][0]} '
+                f'не импортированы: {error}'
+            )
+        return None
+    return objects
+
+
+def run(records, kind, batch_size=1000, transaction_size=10000,
+        checkpoint=None, progress=None, report=None, affected=None):
+    """Импортирует записи, возвращает (обработано, создано, ошибки).
+
+    ``progress`` вызывается после каждой транзакции с теми же тремя
+    числами. Ошибочные записи пропускаются и считаются обработанными.
+    Пачка, которую база отвергла (например, повтор явного id),
+    пропускается целиком, а ``report`` получает её описание.
+    Затронутые id добавляются в ``affected`` и сохраняются рядом
+    с контрольной точкой.
+    """
+    importer = IMPORTERS[kind]()
+    done = read_checkpoint(checkpoint) if checkpoint else 0
+    if checkpoint and affected is not None:
+        affected.load(checkpoint)
+    created = errors = 0
+    records = islice(records, done, None)
+    insert_size = insert_batch_size(importer.model, batch_size)
+    for chunk in chunks(records, transaction_size):
+        numbered, errors_built = _build(
+            importer, kind, chunk, done + 1, batch_size
+        )
+        errors += errors_built
+        with transaction.atomic():
+            for batch in chunks(numbered, insert_size):
+                objects = _insert(importer, batch, insert_size, report)
+                if objects is None:
+                    errors += len(batch)
+                    continue
+                created += len(objects)
+                if affected is not None:
+                    importer.collect(objects, affected)
+        done += len(chunk)
+        if checkpoint:
+            # id сохраняются раньше точки: прерванная запись точки
+            # не теряет затронутые
+            if affected is not None:
+                affected.save(checkpoint)
+            write_checkpoint(checkpoint, done)
+        if progress is not None:
+            progress(done, created, errors)
+    reset_sequence(importer.model)
+    return done, created, errors
+
+
+def rebuild_affected(affected):
+    """Пересобирает ленты, счётчики и индекс только затронутых.
+
+    Возвращает число пересобранных лент. Ленты подписчиков авторов,
+    чьи посты подмешиваются при чтении, не пересобираются.
+    """
+    for post_ids in chunks(sorted(affected.posts), AFFECTED_BATCH):
+        counters.reconcile(post_ids=post_ids)
+    readers = set(affected.readers)
+    authors = sorted(affected.authors - timeline.celebrity_ids())
+    for author_ids in chunks(authors, AFFECTED_BATCH):
+        readers.update(Follow.objects.filter(
+            author_id__in=author_ids
+        ).values_list('user_id', flat=True))
+    for user_id in sorted(readers):
+        timeline.rebuild(user_id)
+    # Длина ленты входит в счётчики, поэтому они считаются после лент
+    users = readers | affected.authors | affected.followed
+    for user_ids in chunks(sorted(users), AFFECTED_BATCH):
+        counters.reconcile(user_ids=user_ids)
+    backend = fulltext.get_backend()
+    for author_ids in chunks(sorted(affected.authors), AFFECTED_BATCH):
+        backend.reindex(
+            Post.objects.filter(author_id__in=author_ids).order_by('pk')
+        )
+    return len(readers)
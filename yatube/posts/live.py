@@ -0,0 +1,243 @@
+"""Живое обновление лент: события SSE о новых постах.
+
+После фиксации транзакции с новым постом его id публикуется в каналы
+``all``, ``group:<id>`` и ``author:<id>`` брокера в памяти процесса.
+Обработчик ``events`` ASGI-приложения (``yatube.asgi``) держит
+соединение ``text/event-stream`` и пересылает клиенту события
+подписанных каналов: всех постов, группы или авторов из подписок.
+Переподключившийся клиент присылает ``Last-Event-ID`` и получает
+пропущенные посты. События видят только клиенты процесса, в котором
+создан пост; посты, вставленные ``bulk_create``, событий не дают.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import connection, transaction
+from django.http import HttpRequest, QueryDict
+from django.http.cookie import parse_cookie
+
+from . import follow_graph
+from .models import Group, Post
+
+# Событий в очереди соединения; медленный клиент при переполнении
+# отключается и догоняет по Last-Event-ID
+QUEUE_SIZE = 100
+_CLOSE = None
+
+
+class Subscription:
+    """Очередь событий одного соединения в его цикле событий."""
+
+    def __init__(self, loop, channels):
+        self.loop = loop
+        self.channels = frozenset(channels)
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            event = _CLOSE
+        self.queue.put_nowait(event)
+
+
+class Broker:
+    """Публикация событий из потоков Django подписчикам ASGI."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = defaultdict(set)
+
+    def subscribe(self, loop, channels):
+        subscription = Subscription(loop, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def publish(self, channels, event):
+        with self._lock:
+            # Подписчик нескольких каналов получает событие один раз
+            targets = set().union(
+                *(self._channels.get(channel, ()) for channel in channels)
+            )
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.put, event
+                )
+            except RuntimeError:
+                # Цикл событий соединения уже закрыт
+                self.unsubscribe(subscription)
+
+
+broker = Broker()
+
+
+def post_channels(post):
+    channels = ['all', f'author:{post.author_id}']
+    if post.group_id is not None:
+        channels.append(f'group:{post.group_id}')
+    return channels
+
+
+def announce(post):
+    """Публикует новый пост после фиксации транзакции."""
+    channels = post_channels(post)
+    event = {'id': post.pk}
+    transaction.on_commit(lambda: broker.publish(channels, event))
+
+
+class StreamError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _user(cookies):
+    request = HttpRequest()
+    request.COOKIES = cookies
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(
+        cookies.get(settings.SESSION_COOKIE_NAME)
+    )
+    return get_user(request)
+
+
+def resolve(params, cookies, last_event_id=''):
+    """Каналы потока и id постов, пропущенных после ``last_event_id``.
+
+    ``?group=<slug>`` — посты группы, ``?following=1`` — посты авторов
+    из подписок (нужен вход), без параметров — все посты.
+    """
+    posts = Post.objects.all()
+    if params.get('group'):
+        group = Group.objects.filter(slug=params['group']).first()
+        if group is None:
+            raise StreamError(404, 'Группа не найдена')
+        channels = [f'group:{group.pk}']
+        posts = posts.filter(group=group)
+    elif params.get('following'):
+        user = _user(cookies)
+        if not user.is_authenticated:
+            raise StreamError(403, 'Нужно войти')
+        author_ids = sorted(follow_graph.followed_ids(user))
+        channels = [f'author:{author_id}' for author_id in author_ids]
+        posts = posts.filter(author_id__in=author_ids)
+    else:
+        channels = ['all']
+    missed = []
+    if last_event_id.isdigit():
+        missed = list(
+            posts.filter(pk__gt=int(last_event_id))
+            .order_by('pk').values_list('pk', flat=True)
+            [:settings.LIVE_BACKLOG]
+        )
+    return channels, missed
+
+
+def _resolve_in_thread(*args):
+    try:
+        return resolve(*args)
+    finally:
+        # Поток пула не обслуживает запросы Django: соединение
+        # закрывается сразу
+        connection.close()
+
+
+def format_event(event):
+    data = json.dumps(event)
+    return f'id: {event["id"]}\nevent: post\ndata: {data}\n\n'.encode()
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _respond(send, status, message):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8')],
+    })
+    await send({'type': 'http.response.body', 'body': message.encode()})
+
+
+async def events(scope, receive, send):
+    """ASGI-обработчик потока событий о новых постах."""
+    headers = {
+        name.decode('latin-1'): value.decode('latin-1')
+        for name, value in scope.get('headers', ())
+    }
+    loop = asyncio.get_running_loop()
+    try:
+        channels, missed = await loop.run_in_executor(
+            None, _resolve_in_thread,
+            QueryDict(scope.get('query_string', b'')),
+            parse_cookie(headers.get('cookie', '')),
+            headers.get('last-event-id', ''),
+        )
+    except StreamError as error:
+        await _respond(send, error.status, str(error))
+        return
+    subscription = broker.subscribe(loop, channels)
+    disconnect = asyncio.ensure_future(_disconnected(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                # nginx не должен буферизовать поток
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        chunks = [f'retry: {settings.LIVE_RETRY * 1000}\n\n'.encode()]
+        chunks += [format_event({'id': pk}) for pk in missed]
+        await send({
+            'type': 'http.response.body',
+            'body': b''.join(chunks),
+            'more_body': True,
+        })
+        while True:
+            getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait(
+                {getter, disconnect},
+                timeout=settings.LIVE_KEEPALIVE,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnect in done:
+                getter.cancel()
+                return
+            if getter not in done:
+                getter.cancel()
+                # Комментарий не даёт прокси закрыть молчащее соединение
+                body = b': keepalive\n\n'
+            elif getter.result() is _CLOSE:
+                break
+            else:
+                body = format_event(getter.result())
+            await send({
+                'type': 'http.response.body',
+                'body': body,
+                'more_body': True,
+            })
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        broker.unsubscribe(subscription)
+        disconnect.cancel()
@@ -0,0 +1,104 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from posts.benchmarks import percentile
+from posts.models import Post
+
+User = get_user_model()
+
+BENCHMARK_USERNAME = 'benchmark-db'
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает базу параллельными чтениями ленты и публикациями постов '
+        'и печатает пропускную способность для текущих настроек базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.2,
+            help='Доля операций записи (по умолчанию 0.2)',
+        )
+
+    def describe_mode(self):
+        database = settings.DATABASES['default']
+        mode = [
+            f'engine={connection.vendor}',
+            f'CONN_MAX_AGE={database.get("CONN_MAX_AGE", 0)}',
+        ]
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                mode.append(f'journal_mode={cursor.fetchone()[0]}')
+        pool = database.get('OPTIONS', {}).get('pool')
+        if pool:
+            mode.append(f'pool={pool["max"]}')
+        return ' '.join(mode)
+
+    def worker(self, author, deadline, write_ratio, results):
+        reads, writes, errors = [], [], 0
+        try:
+            while time.monotonic() < deadline:
+                write = random.random() < write_ratio
+                started = time.perf_counter()
+                try:
+                    if write:
+                        Post.objects.create(
+                            author=author, text='Пост нагрузочного теста'
+                        )
+                    else:
+                        list(
+                            Post.objects.for_feed()[:settings.POSTS_OF_PAGE]
+                        )
+                except DatabaseError:
+                    errors += 1
+                else:
+                    elapsed = time.perf_counter() - started
+                    (writes if write else reads).append(elapsed)
+                # Как после ответа на запрос: соединение закрывается,
+                # если CONN_MAX_AGE не разрешает его держать
+                connection.close_if_unusable_or_obsolete()
+        finally:
+            connection.close()
+            results.append((reads, writes, errors))
+
+    def handle(self, *args, **options):
+        author, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        self.stdout.write(self.describe_mode())
+        results = []
+        deadline = time.monotonic() + options['seconds']
+        threads = [
+            threading.Thread(
+                target=self.worker,
+                args=(author, deadline, options['write_ratio'], results),
+            )
+            for _ in range(options['threads'])
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        reads = [value for result in results for value in result[0]]
+        writes = [value for result in results for value in result[1]]
+        errors = sum(result[2] for result in results)
+        for name, latencies in (('чтение', reads), ('запись', writes)):
+            self.stdout.write(
+                f'{name}: {len(latencies) / elapsed:.1f} оп/с, '
+                f'p50 {percentile(latencies, 0.5) * 1000:.1f} мс, '
+                f'p95 {percentile(latencies, 0.95) * 1000:.1f} мс'
+            )
+        self.stdout.write(f'ошибок: {errors}')
+        # Каскад удаления отправляет сигналы: посты уходят из лент
+        # и поискового индекса
+        author.delete()
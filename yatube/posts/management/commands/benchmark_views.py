@@ -0,0 +1,105 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmarks
+
+DEFAULT_BASELINE = os.path.join(
+    settings.BASE_DIR, 'benchmarks', 'baseline.json'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержки p50/p95/p99, SQL-запросы на ответ и '
+        'пропускную способность страниц и сравнивает с базовой линией.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом тестового клиента',
+        )
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера: нагрузка по HTTP вместо '
+                 'тестового клиента',
+        )
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--only', nargs='+', metavar='SCENARIO',
+            help='Только перечисленные сценарии',
+        )
+        parser.add_argument(
+            '--baseline', default=DEFAULT_BASELINE,
+            help='Файл базовой линии, по умолчанию benchmarks/baseline.json',
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результаты как новую базовую линию',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Допустимый рост p95 относительно базовой линии',
+        )
+
+    def handle(self, *args, **options):
+        results = {}
+        for scenario in benchmarks.scenarios():
+            if options['only'] and scenario.name not in options['only']:
+                continue
+            if options['url']:
+                result = benchmarks.run_http(
+                    scenario, options['url'], options['requests'],
+                    options['concurrency'],
+                )
+            else:
+                result = benchmarks.run_client(
+                    scenario, options['requests'], options['warmup'],
+                    options['cold'],
+                )
+            results[scenario.name] = result
+            queries = result['queries']
+            errors = result.get('errors')
+            self.stdout.write(
+                f'{scenario.name:<13} p50 {result["p50_ms"]:>8} мс  '
+                f'p95 {result["p95_ms"]:>8} мс  '
+                f'p99 {result["p99_ms"]:>8} мс  '
+                f'{result["rps"]:>7} запр/с  '
+                f'SQL {"-" if queries is None else queries}'
+                + ('' if errors is None else f'  ошибок {errors}')
+            )
+        mode = 'http' if options['url'] else (
+            'client-cold' if options['cold'] else 'client'
+        )
+        conditions = {'mode': mode, 'dataset': benchmarks.dataset()}
+        path = options['baseline']
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            benchmarks.save_baseline(path, results, {
+                **conditions,
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+            })
+            self.stdout.write(f'Базовая линия записана в {path}')
+            return
+        if not os.path.exists(path):
+            self.stdout.write(f'Базовой линии {path} нет, сравнение пропущено')
+            return
+        baseline = benchmarks.load_baseline(path)
+        differences = benchmarks.mismatch(baseline, conditions)
+        if differences:
+            self.stdout.write(self.style.WARNING(
+                'Базовая линия снята в других условиях, сравнение '
+                'пропущено:\n' + '\n'.join(differences)
+            ))
+            return
+        found = benchmarks.regressions(results, baseline, options['tolerance'])
+        for message in found:
+            self.stdout.write(self.style.ERROR(message))
+        if found:
+            raise CommandError(f'Ухудшений: {len(found)}')
+        self.stdout.write(self.style.SUCCESS('Ухудшений нет'))
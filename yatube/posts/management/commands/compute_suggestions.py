@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import follow_graph
+from posts.models import Follow
+
+
+class Command(BaseCommand):
+    help = 'Считает рекомендации авторов «друзья друзей» и пишет в базу.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, help='id пользователя, по умолчанию все'
+        )
+
+    def handle(self, *args, **options):
+        users = Follow.objects.order_by('user_id').values_list(
+            'user_id', flat=True
+        ).distinct()
+        if options['user']:
+            users = users.filter(user_id=options['user'])
+        total = 0
+        for user_id in users.iterator():
+            follow_graph.store_suggestions(
+                user_id, follow_graph.compute_suggestions(user_id)
+            )
+            total += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендации посчитаны для пользователей: {total}'
+        ))
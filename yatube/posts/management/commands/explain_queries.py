@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import query_plans
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает планы горячих запросов лент и отмечает полные '
+        'просмотры таблиц и сортировки без индекса.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Завершиться с ошибкой, если есть замечания',
+        )
+
+    def handle(self, *args, **options):
+        flagged = 0
+        for name, queryset in query_plans.hot_querysets():
+            plan, problems = query_plans.analyze(queryset)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            for problem in problems:
+                self.stdout.write(self.style.WARNING(f'  ! {problem}'))
+            flagged += bool(problems)
+        if flagged and options['strict']:
+            raise CommandError(f'Запросов с замечаниями: {flagged}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Запросов с замечаниями: {flagged}'
+        ))
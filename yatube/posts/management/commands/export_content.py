@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import exporting
+from posts.models import Group, User
+
+
+class Command(BaseCommand):
+    help = 'Выгружает данные пользователя или посты группы в JSONL/CSV.'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--user', help='Имя пользователя')
+        source.add_argument('--group', help='Адрес (slug) группы')
+        parser.add_argument(
+            '--format',
+            choices=sorted(exporting.SERIALIZERS),
+            default='jsonl',
+            help='Формат выгрузки',
+        )
+        parser.add_argument(
+            '--output', help='Файл выгрузки, по умолчанию stdout'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['user']:
+                records = exporting.user_records(
+                    User.objects.get(username=options['user'])
+                )
+            else:
+                records = exporting.group_records(
+                    Group.objects.get(slug=options['group'])
+                )
+        except (User.DoesNotExist, Group.DoesNotExist) as error:
+            raise CommandError(error)
+        serialize, _ = exporting.SERIALIZERS[options['format']]
+        if options['output']:
+            with open(
+                options['output'], 'w', encoding='utf-8', newline=''
+            ) as target:
+                target.writelines(serialize(records))
+        else:
+            for line in serialize(records):
+                self.stdout.write(line, ending='')
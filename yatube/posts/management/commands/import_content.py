@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import caching, importing
+from posts.models import Group
+
+
+class Command(BaseCommand):
+    help = 'Импортирует посты, комментарии или подписки из JSONL/CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с записями')
+        parser.add_argument(
+            '--kind',
+            choices=sorted(importing.IMPORTERS),
+            required=True,
+            help='Что импортируется',
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(importing.READERS),
+            help='Формат файла, по умолчанию по расширению',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пачки bulk_create',
+        )
+        parser.add_argument(
+            '--transaction-size', type=int, default=10000,
+            help='Число записей в одной транзакции',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки, по умолчанию <path>.checkpoint',
+        )
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Не пересобирать ленты, счётчики и поисковый индекс '
+            'затронутых импортом',
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint'] or f'{options["path"]}.checkpoint'
+        started = time.monotonic()
+
+        def progress(done, created, errors):
+            rate = done / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'Обработано: {done}, создано: {created}, '
+                f'ошибок: {errors} ({rate:.0f} записей/с)'
+            )
+
+        affected = importing.Affected()
+        try:
+            records = importing.read_records(
+                options['path'], options['format']
+            )
+            done, created, errors = importing.run(
+                records,
+                options['kind'],
+                batch_size=max(options['batch_size'], 1),
+                transaction_size=max(options['transaction_size'], 1),
+                checkpoint=checkpoint,
+                progress=progress,
+                report=self.stderr.write,
+                affected=affected,
+            )
+        except (ValueError, OSError) as error:
+            # Битый файл или строка JSON прерывают импорт, точка остаётся
+            raise CommandError(error)
+        if not options['skip_derived']:
+            self.stdout.write('Пересборка производных данных...')
+            timelines = importing.rebuild_affected(affected)
+            self.stdout.write(f'Пересобрано лент: {timelines}')
+            caching.invalidate_posts(
+                [], Group.objects.values_list('pk', flat=True)
+            )
+            # С --skip-derived id остаются для следующего запуска
+            affected.forget(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершён: обработано {done}, создано {created}, '
+            f'ошибок {errors}'
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, help='id пользователя, по умолчанию все'
+        )
+
+    def handle(self, *args, **options):
+        # Ленты без подписок тоже пересобираются: они станут пустыми
+        readers = Follow.objects.order_by().values_list(
+            'user_id', flat=True
+        ).union(
+            TimelineEntry.objects.order_by().values_list('user_id', flat=True)
+        ).order_by('user_id')
+        if options['user']:
+            readers = [options['user']]
+        total = 0
+        for user_id in readers:
+            timeline.rebuild(user_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано лент: {total}'
+        ))
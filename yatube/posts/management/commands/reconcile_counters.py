@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики постов и подписок.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            posts, authors = counters.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f'Постов: {posts}, авторов: {authors}'
+        ))
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from posts import caching, seeding
+from posts.models import Group
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу данными нагрузочного теста: пользователи, '
+        'посты, подписки по закону Ципфа и вирусные посты с комментариями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--follows', type=int, default=300000)
+        parser.add_argument('--comments', type=int, default=500000)
+        parser.add_argument(
+            '--viral', type=int, default=10,
+            help='Число вирусных постов',
+        )
+        parser.add_argument(
+            '--viral-share', type=float, default=0.5,
+            help='Доля комментариев, которая достаётся вирусным постам',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--seed', type=int, default=1,
+            help='Зерно генератора: одинаковые данные при повторном запуске',
+        )
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Не пересобирать ленты, счётчики и поисковый индекс',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(kind, done, created, errors):
+            rate = done / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'{kind}: обработано {done}, создано {created}, '
+                f'ошибок {errors} ({rate:.0f} записей/с)'
+            )
+
+        created = seeding.seed(
+            options['users'],
+            options['posts'],
+            options['follows'],
+            options['comments'],
+            viral=options['viral'],
+            viral_share=options['viral_share'],
+            batch_size=max(options['batch_size'], 1),
+            random_seed=options['seed'],
+            progress=progress,
+        )
+        if not options['skip_derived']:
+            self.stdout.write('Пересборка производных данных...')
+            call_command('reconcile_counters', stdout=self.stdout)
+            call_command('rebuild_timelines', stdout=self.stdout)
+            call_command('rebuild_search_index', stdout=self.stdout)
+        caching.invalidate_posts(
+            [], Group.objects.values_list('pk', flat=True)
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Создано: ' + ', '.join(
+                f'{kind} {count}' for kind, count in created.items()
+            )
+        ))
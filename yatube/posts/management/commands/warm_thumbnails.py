@@ -0,0 +1,38 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры для уже загруженных картинок постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов, по умолчанию по числу ядер',
+        )
+
+    def handle(self, *args, **options):
+        names = list(
+            Post.objects.exclude(image='')
+            .values_list('image', flat=True)
+            .distinct()
+        )
+        # Дочерние процессы не должны наследовать открытые соединения
+        connections.close_all()
+        workers = max(options['workers'] or 1, 1)
+        chunksize = max(len(names) // (workers * 4), 1)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                thumbnails.generate, names, chunksize=chunksize
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок: {len(names)}, с ошибками: {results.count(False)}'
+        ))
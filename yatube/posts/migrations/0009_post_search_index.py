@@ -0,0 +1,46 @@
+# Generated by Django 2.2.16 on 2026-10-18 21:05
+
+from django.db import migrations
+
+# SQL повторяет posts.fulltext на момент миграции: миграция не зависит
+# от кода приложения. Посты, созданные до неё, попадают в индекс
+# командой rebuild_search_index; пока таблица FTS5 пуста, поиск идёт
+# без индекса.
+SQLITE_CREATE = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5('
+    "body, tokenize = 'unicode61 remove_diacritics 2')"
+)
+SQLITE_DROP = 'DROP TABLE IF EXISTS posts_post_fts'
+POSTGRES_CREATE = (
+    'CREATE INDEX IF NOT EXISTS posts_post_text_search ON posts_post '
+    "USING gin (to_tsvector('russian'::regconfig, COALESCE(text, '')))"
+)
+POSTGRES_DROP = 'DROP INDEX IF EXISTS posts_post_text_search'
+
+STATEMENTS = {
+    'sqlite': (SQLITE_CREATE, SQLITE_DROP),
+    'postgresql': (POSTGRES_CREATE, POSTGRES_DROP),
+}
+
+
+def create_search_index(apps, schema_editor):
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements is not None:
+        schema_editor.execute(statements[0])
+
+
+def drop_search_index(apps, schema_editor):
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements is not None:
+        schema_editor.execute(statements[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:47
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_timelines(apps, schema_editor):
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    lengths = TimelineEntry.objects.filter(
+        user=OuterRef('pk')
+    ).order_by().values('user').annotate(total=Count('pk')).values('total')
+    AuthorStats.objects.update(timeline_length=Coalesce(
+        Subquery(lengths, output_field=IntegerField()), 0
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='timelineentry',
+            name='timeline_user_date_idx',
+        ),
+        migrations.AddField(
+            model_name='authorstats',
+            name='timeline_length',
+            field=models.PositiveIntegerField(default=0, verbose_name='Длина ленты'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_date_idx'),
+        ),
+        migrations.RunPython(count_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,144 @@
+import base64
+import binascii
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(obj, date_field='pub_date'):
+    """Непрозрачный курсор из пары (дата, id) объекта или строки
+    ``.values()``."""
+    if isinstance(obj, dict):
+        date, pk = obj[date_field], obj['id']
+    else:
+        date, pk = getattr(obj, date_field), obj.pk
+    raw = f'{date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Разбирает курсор, для битого значения возвращает None."""
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        pub_date, pk = raw.rsplit('|', 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class KeysetPaginator(Paginator):
+    """Пагинация по ключу (pub_date, id) без COUNT(*) и OFFSET.
+
+    Страницы адресуются курсорами ``?after=`` и ``?before=``,
+    поэтому общее число страниц неизвестно: известно лишь,
+    есть ли соседние страницы. Старые ссылки вида ``?page=N``
+    продолжают работать как точка входа в ленту.
+    Поле даты задаёт атрибут ``date_field``, второе поле ключа —
+    ``key_field``.
+    """
+    is_keyset = True
+    date_field = 'pub_date'
+    key_field = 'pk'
+
+    def __init__(self, object_list, per_page, **kwargs):
+        super().__init__(
+            object_list.order_by(
+                f'-{self.date_field}', f'-{self.key_field}'
+            ),
+            per_page,
+            **kwargs
+        )
+        self.has_next = False
+        self.has_previous = False
+
+    def __getstate__(self):
+        # В кеш попадает только текущая страница, без исходного queryset
+        state = self.__dict__.copy()
+        state['object_list'] = None
+        return state
+
+    @property
+    def num_pages(self):
+        return self._number + int(self.has_next)
+
+    @property
+    def _number(self):
+        return 2 if self.has_previous else 1
+
+    def _fetch(self, queryset):
+        return list(queryset[:self.per_page + 1])
+
+    def _after(self, date, pk):
+        # Условие по дате __lte позволяет пройти по индексу диапазоном.
+        field, key = self.date_field, self.key_field
+        return self.object_list.filter(
+            Q(**{f'{field}__lt': date}) | Q(**{f'{key}__lt': pk}),
+            **{f'{field}__lte': date}
+        )
+
+    def _before(self, date, pk):
+        field, key = self.date_field, self.key_field
+        return self.object_list.filter(
+            Q(**{f'{field}__gt': date}) | Q(**{f'{key}__gt': pk}),
+            **{f'{field}__gte': date}
+        ).order_by(field, key)
+
+    def _fetch_after(self, date, pk):
+        return self._fetch(self._after(date, pk))
+
+    def _fetch_before(self, date, pk):
+        return self._fetch(self._before(date, pk))
+
+    def _fetch_slice(self, offset):
+        return list(self.object_list[offset:offset + self.per_page + 1])
+
+    def get_page(self, params):
+        """Возвращает страницу по параметрам запроса ``request.GET``."""
+        after = decode_cursor(params.get('after'))
+        before = decode_cursor(params.get('before'))
+        if after is not None:
+            rows = self._fetch_after(*after)
+            self.has_previous = True
+            self.has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        elif before is not None:
+            rows = self._fetch_before(*before)
+            self.has_next = True
+            self.has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+        else:
+            rows = self._legacy_page(params.get('page'))
+        return self._page(rows)
+
+    def _legacy_page(self, number):
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        offset = (number - 1) * self.per_page
+        rows = self._fetch_slice(offset)
+        if not rows and number > 1:
+            return self._legacy_page(1)
+        self.has_previous = number > 1
+        self.has_next = len(rows) > self.per_page
+        return rows[:self.per_page]
+
+    def _page(self, rows):
+        page = Page(rows, self._number, self)
+        page.next_cursor = (
+            encode_cursor(rows[-1], self.date_field)
+            if self.has_next and rows else None
+        )
+        page.previous_cursor = (
+            encode_cursor(rows[0], self.date_field)
+            if self.has_previous and rows else None
+        )
+        return page
@@ -0,0 +1,94 @@
+"""Планы запросов горячих queryset'ов из ``posts.views``.
+
+Команда ``explain_queries`` строит те же запросы, что и страницы
+(с подставными id), и ищет в плане полный просмотр таблицы или
+сортировку во временной структуре вместо чтения по индексу.
+"""
+import re
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .comments import CommentPaginator, first_replies, replies_after
+from .models import Comment, Follow, Post
+from .paginators import KeysetPaginator
+from .timeline import TimelinePaginator
+
+# Признаки плохого плана для движков, которые знает explain()
+WARNINGS = {
+    'sqlite': (
+        (re.compile(r'\bSCAN (?!.*\bUSING (COVERING )?INDEX\b)'),
+         'полный просмотр таблицы'),
+        (re.compile(r'USE TEMP B-TREE'), 'сортировка во временном B-дереве'),
+    ),
+    'postgresql': (
+        (re.compile(r'Seq Scan'), 'полный просмотр таблицы'),
+        (re.compile(r'\bSort\b'), 'сортировка без индекса'),
+    ),
+}
+
+
+_MOMENT = timezone.make_aware(datetime(2020, 1, 1))
+
+
+def _first_page(paginator_class, queryset, per_page):
+    paginator = paginator_class(queryset, per_page)
+    return paginator.object_list[:per_page + 1]
+
+
+def _next_page(paginator_class, queryset, per_page):
+    paginator = paginator_class(queryset, per_page)
+    return paginator._after(_MOMENT, 1)[:per_page + 1]
+
+
+def hot_querysets(object_id=1):
+    """Пары (имя, queryset) в том виде, в каком их выполняют страницы."""
+    per_page = settings.POSTS_OF_PAGE
+    feeds = {
+        'index': Post.objects.for_feed(),
+        'group_list': Post.objects.filter(group_id=object_id).for_feed(),
+        'profile': Post.objects.filter(author_id=object_id).for_feed(),
+        # Посты знаменитости, подмешиваемые в ленту подписок
+        'follow_index celebrity': Post.objects.filter(
+            author_id=object_id
+        ).for_feed(),
+    }
+    for name, queryset in feeds.items():
+        yield name, _first_page(KeysetPaginator, queryset, per_page)
+        yield f'{name} (after)', _next_page(
+            KeysetPaginator, queryset, per_page
+        )
+    timeline = TimelinePaginator(object_id, per_page)
+    yield 'follow_index', timeline.object_list[:per_page + 1]
+    yield 'follow_index (after)', timeline._after(_MOMENT, 1)[:per_page + 1]
+    comments = Comment.objects.filter(
+        post_id=object_id, parent__isnull=True
+    ).select_related('author')
+    per_page = settings.COMMENTS_OF_PAGE
+    yield 'comments', _first_page(CommentPaginator, comments, per_page)
+    yield 'comments (after)', _next_page(CommentPaginator, comments, per_page)
+    replies = settings.REPLIES_OF_THREAD
+    yield 'comment replies', first_replies([object_id, 1], replies)
+    yield 'comment replies (after)', replies_after(
+        object_id, _MOMENT, 1
+    )[:replies + 1]
+    yield 'followers', Follow.objects.filter(
+        author_id=object_id
+    ).order_by('-pk')[:51]
+    yield 'following', Follow.objects.filter(
+        user_id=object_id
+    ).order_by('-pk')[:51]
+
+
+def analyze(queryset):
+    """План запроса и список найденных в нём проблем."""
+    plan = queryset.explain()
+    problems = [
+        f'{message}: {line.strip()}'
+        for line in plan.splitlines()
+        for pattern, message in WARNINGS.get(connection.vendor, ())
+        if pattern.search(line)
+    ]
+    return plan, problems
@@ -0,0 +1,160 @@
+"""Синтетические данные для нагрузочного тестирования.
+
+Пользователи и группы создаются ``bulk_create``, посты, подписки и
+комментарии идут генераторами записей через ``importing.run``, как
+при импорте. Авторы выбираются по закону Ципфа: несколько авторов
+пишут много и собирают почти всех подписчиков, у большинства их
+единицы. Заданная доля комментариев достаётся нескольким «вирусным»
+постам.
+"""
+import random
+from bisect import bisect_left
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.db.models import Max
+from django.utils import timezone
+
+from . import importing
+from .models import Group, Post, User
+
+USERNAME = 'bench{}'
+GROUP_SLUG = 'bench-group-{}'
+GROUPS = 20
+# Доля постов, опубликованных в группах
+GROUP_SHARE = 0.3
+# Показатель степени в законе Ципфа для авторов
+ZIPF_EXPONENT = 1.1
+PERIOD = timedelta(days=365)
+
+WORDS = (
+    'лента подписка автор группа пост комментарий новость фото день '
+    'город музыка книга кино код работа отпуск погода утро вечер'
+).split()
+
+
+class ZipfChooser:
+    """Случайный номер от 0 до size - 1 с весом 1 / (номер + 1) ** s."""
+
+    def __init__(self, size, exponent=ZIPF_EXPONENT, rng=random):
+        self.rng = rng
+        self.cum_weights = list(accumulate(
+            1 / (rank + 1) ** exponent for rank in range(size)
+        ))
+
+    def __call__(self):
+        point = self.rng.random() * self.cum_weights[-1]
+        return bisect_left(self.cum_weights, point)
+
+
+def _text(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _date(rng, now):
+    return (now - PERIOD * rng.random()).isoformat()
+
+
+def create_users(count, batch_size=1000):
+    """Создаёт недостающих пользователей bench0…, возвращает их имена."""
+    names = [USERNAME.format(number) for number in range(count)]
+    existing = set(
+        User.objects.filter(username__in=names).values_list(
+            'username', flat=True
+        )
+    )
+    password = make_password(None)
+    User.objects.bulk_create(
+        [
+            User(username=name, password=password)
+            for name in names if name not in existing
+        ],
+        batch_size=importing.insert_batch_size(User, batch_size),
+    )
+    return names
+
+
+def create_groups(count=GROUPS):
+    slugs = [GROUP_SLUG.format(number) for number in range(count)]
+    existing = set(
+        Group.objects.filter(slug__in=slugs).values_list('slug', flat=True)
+    )
+    Group.objects.bulk_create([
+        Group(title=f'Группа {slug}', slug=slug, description='Нагрузка')
+        for slug in slugs if slug not in existing
+    ])
+    return slugs
+
+
+def post_records(names, slugs, count, first_id, rng):
+    author = ZipfChooser(len(names), rng=rng)
+    now = timezone.now()
+    for number in range(count):
+        in_group = rng.random() < GROUP_SHARE
+        yield {
+            'id': first_id + number,
+            'author': names[author()],
+            'group': rng.choice(slugs) if in_group else '',
+            'text': _text(rng),
+            'pub_date': _date(rng, now),
+        }
+
+
+def follow_records(names, count, rng):
+    """Подписки на авторов по закону Ципфа: у первых тысячи читателей."""
+    author = ZipfChooser(len(names), rng=rng)
+    for _ in range(count):
+        user, followed = rng.randrange(len(names)), author()
+        if user != followed:
+            yield {'user': names[user], 'author': names[followed]}
+
+
+def comment_records(names, post_ids, count, viral, viral_share, rng):
+    viral_ids = rng.sample(post_ids, min(viral, len(post_ids)))
+    now = timezone.now()
+    for _ in range(count):
+        if viral_ids and rng.random() < viral_share:
+            post_id = rng.choice(viral_ids)
+        else:
+            post_id = rng.choice(post_ids)
+        yield {
+            'post': post_id,
+            'author': rng.choice(names),
+            'text': _text(rng, words=6),
+            'created': _date(rng, now),
+        }
+
+
+def seed(users, posts, follows, comments, viral=10, viral_share=0.5,
+         batch_size=1000, random_seed=None, progress=None):
+    """Наполняет базу данными нагрузочного теста.
+
+    ``progress(kind, done, created, errors)`` вызывается после каждой
+    транзакции импорта. Возвращает число созданных записей по видам.
+    """
+    rng = random.Random(random_seed)
+    names = create_users(users, batch_size)
+    slugs = create_groups()
+
+    def report(kind):
+        if progress is None:
+            return None
+        return lambda *counts: progress(kind, *counts)
+
+    first_id = (Post.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+    created = {'post': importing.run(
+        post_records(names, slugs, posts, first_id, rng), 'post',
+        batch_size=batch_size, progress=report('post'),
+    )[1]}
+    created['follow'] = importing.run(
+        follow_records(names, follows, rng), 'follow',
+        batch_size=batch_size, progress=report('follow'),
+    )[1]
+    post_ids = list(range(first_id, first_id + posts))
+    created['comment'] = importing.run(
+        comment_records(names, post_ids, comments, viral, viral_share, rng)
+        if post_ids else iter(()),
+        'comment', batch_size=batch_size, progress=report('comment'),
+    )[1]
+    return created
@@ -0,0 +1,120 @@
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import caching, counters, follow_graph, fulltext, live, timeline
+from .models import Comment, Follow, Group, Post
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_live_update(sender, instance, created, **kwargs):
+    if created:
+        live.announce(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_created_counters(sender, instance, created, **kwargs):
+    if created:
+        counters.bump(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted_counters(sender, instance, **kwargs):
+    counters.bump(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def post_search_index(sender, instance, using, update_fields=None,
+                      **kwargs):
+    if update_fields is None or 'text' in update_fields:
+        fulltext.get_backend(using).index([instance])
+
+
+@receiver(post_delete, sender=Post)
+def post_search_remove(sender, instance, using, **kwargs):
+    fulltext.get_backend(using).remove([instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+def comment_created_counters(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted_counters(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_backfill(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created_counters(sender, instance, created, **kwargs):
+    if created:
+        counters.bump(instance.author_id, 'followers_count', 1)
+        counters.bump(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def unfollow_cleanup(sender, instance, **kwargs):
+    timeline.remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted_counters(sender, instance, **kwargs):
+    counters.bump(instance.author_id, 'followers_count', -1)
+    counters.bump(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_invalidate_cache(sender, instance, **kwargs):
+    follow_graph.invalidate_followed(instance.user_id)
+    caching.invalidate_follows([instance.user_id, instance.author_id])
+
+
+@receiver(pre_save, sender=Post)
+def post_remember_group(sender, instance, using, raw, **kwargs):
+    # Прежняя группа читается только при сохранении, чтение постов
+    # ничего не платит
+    instance._previous_group_id = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._previous_group_id = Post.objects.using(using).filter(
+        pk=instance.pk
+    ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_invalidate_cache(sender, instance, **kwargs):
+    group_ids = {
+        instance.group_id, getattr(instance, '_previous_group_id', None)
+    } - {None}
+    caching.invalidate_post(instance.pk, group_ids)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_invalidate_cache(sender, instance, **kwargs):
+    caching.invalidate_post(instance.post_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_invalidate_cache(sender, instance, **kwargs):
+    caching.invalidate_posts(
+        instance.posts.values_list('pk', flat=True).iterator(),
+        [instance.pk],
+    )
@@ -0,0 +1,16 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def responsive_image(image, variant):
+    """Картинка поста с вариантами ширин и форматов в srcset."""
+    picture = None
+    if image:
+        picture = thumbnails.picture_or_schedule(
+            image.name, variant, image.instance.pk
+        )
+    return {'image': image, 'picture': picture}
@@ -1,17 +1,24 @@
+import os
 import shutil
 import tempfile
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from sorl.thumbnail import get_thumbnail
 
+from core import routers
+
+from .. import comment_buffer, thumbnails
 from ..models import Comment, Group, Post, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+# Без фонового пула: миниатюры создаются в тестах явно
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PostFormTests(TestCase):
     @classmethod
     def setUpClass(cls) -> None:
@@ -173,3 +180,75 @@ class PostFormTests(TestCase):
             )
         )
         self.assertEqual(Comment.objects.count(), comment_count)
+
+    def test_thumbnails_generated_for_post_image(self):
+        """Миниатюры всех размеров ленты создаются заранее."""
+        self.assertTrue(thumbnails.generate(self.posts.image.name))
+        for geometry, options in thumbnails.THUMBNAIL_SIZES:
+            with self.subTest(geometry=geometry):
+                thumbnail = get_thumbnail(
+                    self.posts.image.name, geometry, **options
+                )
+                self.assertTrue(os.path.exists(
+                    os.path.join(TEMP_MEDIA_ROOT, thumbnail.name)
+                ))
+
+
+class CommentEndpointTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='commenter')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('posts:comment_create', args=(self.post.pk,))
+        self.addCleanup(comment_buffer.flush)
+
+    def test_comment_endpoint_returns_fragment(self):
+        """Эндпоинт отдаёт JSON с фрагментом нового комментария."""
+        response = self.client.post(self.url, {'text': 'Быстрый ответ'})
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(
+            data['id'], Comment.objects.get(text='Быстрый ответ').pk
+        )
+        self.assertIn('Быстрый ответ', data['html'])
+        response = self.client.post(self.url, {'text': ''})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('text', response.json()['errors'])
+
+    @override_settings(COMMENT_BATCH_SIZE=2)
+    def test_write_behind_flushes_full_batch(self):
+        """Отложенные комментарии пишутся одной пачкой."""
+        first = self.client.post(self.url, {'text': 'первый'})
+        self.assertEqual(first.status_code, 202)
+        self.assertTrue(first.json()['pending'])
+        self.assertFalse(Comment.objects.exists())
+        self.client.post(self.url, {'text': 'второй'})
+        self.assertEqual(Comment.objects.count(), 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+
+    @override_settings(COMMENT_BATCH_SIZE=10)
+    def test_failed_batch_drops_only_bad_rows(self):
+        """Сбой пачки отбрасывает только строки, отвергнутые базой."""
+        comment_buffer.add(Comment(post=self.post, author=self.user,
+                                   text='целый'))
+        comment_buffer.add(Comment(post=self.post, text=None))
+        with self.assertLogs('posts.comment_buffer', 'ERROR'):
+            self.assertEqual(comment_buffer.flush(), 1)
+        self.assertEqual(
+            list(Comment.objects.values_list('text', flat=True)), ['целый']
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+    @override_settings(REPLICA_DATABASES=['default'])
+    def test_comment_pins_author_to_primary(self):
+        """После комментария автор читает с основной базы."""
+        cache.delete(routers.PIN_KEY.format(self.user.pk))
+        self.assertFalse(routers.is_pinned(self.user))
+        self.client.post(self.url, {'text': 'свежий'})
+        self.assertTrue(routers.is_pinned(self.user))
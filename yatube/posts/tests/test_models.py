@@ -1,7 +1,14 @@
+import os
+import tempfile
+from io import StringIO
+from itertools import islice
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
 
-from ..models import Group, Post, Comment, Follow
+from .. import benchmarks, exporting, fulltext, importing
+from ..models import AuthorStats, Group, Post, Comment, Follow, TimelineEntry
 
 User = get_user_model()
 
@@ -71,3 +78,291 @@ class PostModelTest(TestCase):
             user_follower.user.username,
             str(user_follower),
         )
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='auth')
+        self.author = User.objects.create(username='Saraj')
+        self.post = Post.objects.create(author=self.author, text='Текст')
+        self.comment = Comment.objects.create(
+            post=self.post, author=self.user, text='text comment'
+        )
+        self.follow = Follow.objects.create(
+            user=self.user, author=self.author
+        )
+
+    def assertCounters(self, posts, followers, following, comments):
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, posts)
+        self.assertEqual(stats.followers_count, followers)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user).following_count,
+            following,
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, comments)
+
+    def test_counters_follow_writes(self):
+        """Счётчики сдвигаются при создании и удалении записей."""
+        self.assertCounters(posts=1, followers=1, following=1, comments=1)
+        self.comment.delete()
+        Follow.objects.filter(user=self.user).delete()
+        Post.objects.create(author=self.author, text='Ещё текст')
+        self.assertCounters(posts=2, followers=0, following=0, comments=0)
+
+    def test_reconcile_counters_fixes_drift(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        AuthorStats.objects.update(
+            posts_count=7, followers_count=7, following_count=7
+        )
+        Post.objects.update(comments_count=7)
+        AuthorStats.objects.filter(user=self.user).delete()
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertCounters(posts=1, followers=1, following=1, comments=1)
+
+
+class UserDeleteTest(TransactionTestCase):
+    def test_delete_user_with_posts_and_follows(self):
+        """Каскадное удаление не создаёт счётчики удаляемого заново."""
+        user = User.objects.create(username='leaving')
+        author = User.objects.create(username='author')
+        reader = User.objects.create(username='reader')
+        Post.objects.create(author=user, text='Текст')
+        Follow.objects.create(user=user, author=author)
+        Follow.objects.create(user=reader, author=user)
+        user_id = user.pk
+        user.delete()
+        self.assertFalse(AuthorStats.objects.filter(user_id=user_id).exists())
+        self.assertEqual(
+            AuthorStats.objects.get(user=author).followers_count, 0
+        )
+        self.assertEqual(
+            AuthorStats.objects.get(user=reader).following_count, 0
+        )
+
+
+class ImportContentTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.author = User.objects.create(username='writer')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write(content)
+        return path
+
+    def test_import_posts_comments_and_follows(self):
+        """Импорт создаёт записи и пересобирает производные данные."""
+        follows = self.write('follows.csv', 'user,author\nreader,writer\n')
+        posts = self.write('posts.jsonl', '\n'.join([
+            '{"id": 100, "text": "Первый", "author": "writer", '
+            '"group": "group", "pub_date": "2020-01-01T10:00:00+00:00"}',
+            '{"id": 101, "text": "Без автора", "author": "nobody"}',
+            '{"id": 102, "text": "Второй", "author": "writer"}',
+        ]))
+        comments = self.write(
+            'comments.csv', 'post,author,text\n100,reader,Комментарий\n'
+        )
+        for kind, path in (
+            ('follow', follows), ('post', posts), ('comment', comments)
+        ):
+            call_command(
+                'import_content', path, kind=kind, batch_size=2,
+                stdout=StringIO(),
+            )
+        post = Post.objects.get(pk=100)
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.comments_count, 1)
+        self.assertFalse(Post.objects.filter(pk=101).exists())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 2
+        )
+        self.assertEqual(self.author.stats.posts_count, 2)
+
+    def test_duplicate_id_skips_only_its_batch(self):
+        """Повтор явного id пропускает его пачку, импорт продолжается."""
+        path = self.write('posts.jsonl', '\n'.join([
+            '{"id": 100, "text": "Первый", "author": "writer"}',
+            '{"id": 100, "text": "Повтор", "author": "writer"}',
+            '{"id": 102, "text": "Третий", "author": "writer"}',
+        ]))
+        errors = StringIO()
+        call_command(
+            'import_content', path, kind='post', batch_size=1,
+            stdout=StringIO(), stderr=errors,
+        )
+        self.assertIn('Записи 2–2 не импортированы', errors.getvalue())
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list('text', flat=True)),
+            ['Первый', 'Третий'],
+        )
+        self.assertEqual(
+            fulltext.get_backend().ranked_ids('третий', 10), [102]
+        )
+        self.assertEqual(self.author.stats.posts_count, 2)
+
+    def test_import_resumes_from_checkpoint(self):
+        """Повторный запуск продолжает импорт с контрольной точки."""
+        path = self.write('posts.csv', 'text,author\nПервый,writer\n')
+        checkpoint = self.write('posts.checkpoint', '1')
+        with open(path, 'a', encoding='utf-8') as target:
+            target.write('Второй,writer\n')
+        call_command(
+            'import_content', path, kind='post', checkpoint=checkpoint,
+            skip_derived=True, stdout=StringIO(),
+        )
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)), ['Второй']
+        )
+        with open(checkpoint, encoding='utf-8') as source:
+            self.assertEqual(source.read(), '2')
+
+    def test_resumed_import_rebuilds_rows_before_crash(self):
+        """Продолженный импорт пересобирает и строки прерванного."""
+        path = self.write(
+            'posts.csv', 'text,author\nПервый,writer\nВторой,writer\n'
+        )
+        checkpoint = f'{path}.checkpoint'
+        # Прерванный запуск успел вставить первую строку
+        records = importing.read_records(path)
+        importing.run(
+            islice(records, 1), 'post', checkpoint=checkpoint,
+            affected=importing.Affected(),
+        )
+        call_command(
+            'import_content', path, kind='post', stdout=StringIO()
+        )
+        self.assertEqual(self.author.stats.posts_count, 2)
+        self.assertEqual(
+            len(fulltext.get_backend().ranked_ids('первый', 10)), 1
+        )
+        self.assertFalse(
+            os.path.exists(importing.Affected.path(checkpoint))
+        )
+
+    def test_comment_threads_survive_export_round_trip(self):
+        """Выгрузка и импорт комментариев сохраняют ветки ответов."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        root = Comment.objects.create(
+            post=post, author=self.user, text='Корень'
+        )
+        reply = Comment.objects.create(
+            post=post, author=self.author, text='Ответ',
+            parent=root, thread=root,
+        )
+        Comment.objects.create(
+            post=post, author=self.user, text='Ответ на ответ',
+            parent=reply, thread=root,
+        )
+        path = self.write('comments.jsonl', ''.join(exporting.to_jsonl(
+            exporting.comment_records(Comment.objects.all())
+        )))
+        expected = list(Comment.objects.order_by('pk').values_list(
+            'pk', 'parent_id', 'thread_id'
+        ))
+        Comment.objects.all().delete()
+        call_command(
+            'import_content', path, kind='comment', batch_size=1,
+            stdout=StringIO(),
+        )
+        self.assertEqual(
+            list(Comment.objects.order_by('pk').values_list(
+                'pk', 'parent_id', 'thread_id'
+            )),
+            expected,
+        )
+
+    def test_existing_follows_are_not_counted_as_created(self):
+        """Существующие и повторные подписки не считаются созданными."""
+        Follow.objects.create(user=self.user, author=self.author)
+        path = self.write(
+            'follows.csv',
+            'user,author\nreader,writer\nwriter,reader\nwriter,reader\n',
+        )
+        output = StringIO()
+        call_command(
+            'import_content', path, kind='follow', stdout=output
+        )
+        self.assertIn('создано 1,', output.getvalue())
+        self.assertEqual(Follow.objects.count(), 2)
+
+
+class QueryPlanTest(TestCase):
+    def test_hot_queries_use_indexes(self):
+        """Горячие запросы лент читаются по индексам без сортировок."""
+        output = StringIO()
+        call_command('explain_queries', strict=True, stdout=output)
+        self.assertIn('Запросов с замечаниями: 0', output.getvalue())
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        call_command(
+            'seed_benchmark', users=30, posts=300, follows=200,
+            comments=200, viral=2, viral_share=0.8, stdout=StringIO(),
+        )
+
+    def test_seed_follows_power_law_and_viral_posts(self):
+        """Подписчики сосредоточены у первых авторов, комментарии —
+        у вирусных постов."""
+        followers = sorted(
+            AuthorStats.objects.values_list('followers_count', flat=True),
+            reverse=True,
+        )
+        self.assertGreater(followers[0], 4 * followers[len(followers) // 2])
+        viral = Post.objects.order_by('-comments_count')[:2]
+        self.assertGreaterEqual(
+            sum(post.comments_count for post in viral), 150
+        )
+        self.assertTrue(TimelineEntry.objects.exists())
+
+    def test_scenarios_report_latency_and_queries(self):
+        """Каждый сценарий отвечает и сравнивается с базовой линией."""
+        results = {
+            scenario.name: benchmarks.run_client(scenario, 3, warmup=1)
+            for scenario in benchmarks.scenarios()
+        }
+        self.assertEqual(set(results), {
+            'index', 'group_list', 'profile', 'follow_index', 'post_detail'
+        })
+        self.assertGreater(results['post_detail']['queries'], 0)
+        baseline = {'scenarios': {
+            name: dict(result, queries=result['queries'] - 1)
+            for name, result in results.items()
+        }}
+        self.assertEqual(
+            len(benchmarks.regressions(results, baseline, 10)), len(results)
+        )
+
+    def test_baseline_from_other_dataset_is_not_compared(self):
+        """Базовая линия с другим объёмом данных не сравнивается."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'baseline.json')
+        call_command(
+            'benchmark_views', requests=1, warmup=0, only=['index'],
+            baseline=path, save_baseline=True, stdout=StringIO(),
+        )
+        baseline = benchmarks.load_baseline(path)
+        self.assertEqual(
+            benchmarks.mismatch(baseline, {
+                'mode': 'client', 'dataset': benchmarks.dataset()
+            }),
+            [],
+        )
+        Post.objects.create(author=User.objects.first(), text='Ещё')
+        output = StringIO()
+        call_command(
+            'benchmark_views', requests=1, warmup=0, only=['index'],
+            baseline=path, stdout=output,
+        )
+        self.assertIn('сравнение пропущено', output.getvalue())
+        self.assertIn('dataset', output.getvalue())
@@ -3,7 +3,9 @@ from django.contrib.auth import get_user_model
 from django.urls.base import reverse
 from django.core.cache import cache
 
-from ..models import Group, Post
+from ..models import Comment, Group, Post
+
+from yatube.settings import POSTS_OF_PAGE
 
 User = get_user_model()
 
@@ -108,14 +110,54 @@ class CacheTests(TestCase):
         cache.clear()
 
     def test_cache_work(self):
-        """Проверяем что кеш хранит данные даже после удаления поста,
-        пост не показвается после принудельной очистки кеша.
+        """Проверяем что страница отдаётся из кеша без запросов к базе,
+        а удалённый пост сразу пропадает из ленты.
         """
         response = self.guest_client.get(reverse('posts:index'))
         self.assertContains(response, CacheTests.post)
-        CacheTests.post.delete()
-        response_2 = self.guest_client.get(reverse('posts:index'))
+        with self.assertNumQueries(0):
+            response_2 = self.guest_client.get(reverse('posts:index'))
         self.assertContains(response_2, CacheTests.post)
-        cache.clear()
+        CacheTests.post.delete()
         response_3 = self.guest_client.get(reverse('posts:index'))
         self.assertNotContains(response_3, CacheTests.post)
+
+    def test_cache_keys_include_page_cursor(self):
+        """Вторая страница ленты не отдаёт закешированную первую."""
+        Post.objects.bulk_create([
+            Post(author=CacheTests.user, text=f'Текст {num}')
+            for num in range(POSTS_OF_PAGE)
+        ])
+        first = self.guest_client.get(reverse('posts:index'))
+        second = self.guest_client.get(reverse('posts:index'), {'page': 2})
+        self.assertNotEqual(
+            list(first.context['page_obj'].object_list),
+            list(second.context['page_obj'].object_list),
+        )
+
+    def test_comment_invalidates_post_card(self):
+        """Новый комментарий обновляет карточку поста в ленте."""
+        post = Post.objects.create(author=CacheTests.user, text='Текст')
+        self.guest_client.get(reverse('posts:index'))
+        Comment.objects.create(
+            post=post, author=CacheTests.user, text='Комментарий'
+        )
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Комментариев: 1')
+
+    def test_group_page_cache_follows_group_writes(self):
+        """Страница группы кешируется и сбрасывается записью в группу,
+        в том числе при переносе поста в другую группу.
+        """
+        post = Post.objects.create(
+            author=CacheTests.user, text='Пост группы', group=CacheTests.group
+        )
+        url = reverse('posts:group_list', args=[CacheTests.group.slug])
+        self.guest_client.get(url)
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url)
+        self.assertContains(response, post.text)
+        post = Post.objects.get(pk=post.pk)
+        post.group = Group.objects.create(title='Другая', slug='other')
+        post.save()
+        self.assertNotContains(self.guest_client.get(url), post.text)
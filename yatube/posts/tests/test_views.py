@@ -1,16 +1,28 @@
+import asyncio
+import csv
+import json
 import shutil
 import tempfile
+from io import StringIO
 
 from http import HTTPStatus
 
 from django.core.cache import cache
+from django.core.management import call_command
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 
-from posts.models import Post, Group, Follow
+from posts import follow_graph, fulltext, live, thumbnails
+from posts.models import (
+    AuthorStats, Comment, Post, Group, Follow, TimelineEntry
+)
 
 from yatube.settings import POSTS_OF_PAGE
 
@@ -105,6 +117,32 @@ class PostPagesTest(TestCase):
                         count,
                     )
 
+    def test_paginator_cursor_navigation(self):
+        """Переход по курсорам after/before без номеров страниц."""
+        Post.objects.bulk_create([
+            Post(text=f'posts #{num}', author=PostPagesTest.user)
+            for num in range(POSTS_OF_PAGE + 2)
+        ])
+        url = reverse('posts:index')
+        first = self.guest_client.get(url).context['page_obj']
+        self.assertIsNone(first.previous_cursor)
+        second = self.guest_client.get(
+            url, {'after': first.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(second.object_list), 3)
+        self.assertIsNone(second.next_cursor)
+        self.assertFalse(
+            set(first.object_list) & set(second.object_list)
+        )
+        back = self.guest_client.get(
+            url, {'before': second.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back.object_list), list(first.object_list))
+        broken = self.guest_client.get(
+            url, {'after': 'not-a-cursor'}
+        ).context['page_obj']
+        self.assertEqual(list(broken.object_list), list(first.object_list))
+
     def test_post_not_in_any_group(self):
         """Проверка, что созданный пост не попал в группу,
         для которой не был предназначен.
@@ -126,7 +164,8 @@ class PostPagesTest(TestCase):
         self.assertEqual(post.description, PostPagesTest.group.description)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+# Без фонового пула: миниатюры создаются в тестах явно
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class ImageTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -184,6 +223,32 @@ class ImageTest(TestCase):
                 self.assertIn(img, response.content.decode('utf-8'))
                 self.assertEqual(response.status_code, HTTPStatus.OK)
 
+    def test_image_rendered_with_srcset_variants(self):
+        """Картинка выводится набором ширин через srcset."""
+        thumbnails.generate(self.posts.image.name)
+        response = self.guest_client.get(
+            reverse('posts:post_detail', args=[self.posts.id])
+        )
+        content = response.content.decode('utf-8')
+        self.assertIn('<picture>', content)
+        for width in thumbnails.VARIANTS['detail']['widths']:
+            with self.subTest(width=width):
+                self.assertIn(f' {width}w', content)
+
+    def test_missing_thumbnails_are_not_generated_in_request(self):
+        """Без миниатюр показывается оригинал, а готовые миниатюры
+        сбрасывают карточку поста."""
+        name = 'posts/no_thumbnails.gif'
+        Post.objects.filter(pk=self.posts.pk).update(image=name)
+        default_storage.save(name, ContentFile(self.posts.image.read()))
+        url = reverse('posts:index')
+        content = self.guest_client.get(url).content.decode('utf-8')
+        self.assertNotIn('<picture>', content)
+        self.assertIsNone(thumbnails.picture(name, 'card'))
+        thumbnails._generate_in_worker(name, self.posts.pk)
+        content = self.guest_client.get(url).content.decode('utf-8')
+        self.assertIn('<picture>', content)
+
 
 class FollowTest(TestCase):
 
@@ -260,3 +325,554 @@ class FollowTest(TestCase):
             reverse('posts:follow_index')
         )
         self.assertNotIn(post.text, response.content.decode('utf-8'))
+
+    def test_timeline_fan_out_and_unfollow(self):
+        """Пост раскладывается по лентам подписчиков и убирается
+        из ленты после отписки.
+        """
+        cache.clear()
+        Follow.objects.create(user=self.user_1, author=self.user_2)
+        post = Post.objects.create(author=self.user_2, text='fan out')
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.user_1, post=post
+            ).exists()
+        )
+        Follow.objects.filter(user=self.user_1, author=self.user_2).delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user_1).exists()
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_timeline_reads_celebrity_posts_on_request(self):
+        """Посты популярного автора не раскладываются,
+        но попадают в ленту при чтении.
+        """
+        cache.clear()
+        Follow.objects.create(user=self.user_1, author=self.user_2)
+        cache.clear()
+        post = Post.objects.create(author=self.user_2, text='celebrity')
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.authorized_client.get(
+            reverse('posts:follow_index')
+        )
+        self.assertIn(post, response.context['page_obj'].object_list)
+        cache.clear()
+
+    @override_settings(TIMELINE_MAX_LENGTH=10)
+    def test_fan_out_keeps_timeline_length(self):
+        """Раскладка обрезает ленту активного читателя."""
+        cache.clear()
+        Follow.objects.create(user=self.user_1, author=self.user_2)
+        for number in range(25):
+            Post.objects.create(author=self.user_2, text=f'Пост {number}')
+            length = TimelineEntry.objects.filter(user=self.user_1).count()
+            self.assertLessEqual(length, 10)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user_1).timeline_length,
+            length,
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2, POSTS_OF_PAGE=3)
+    def test_feed_pages_merge_timeline_and_celebrities(self):
+        """Курсоры проходят ленту и посты знаменитостей без повторов."""
+        cache.clear()
+        reader = User.objects.create(username='reader')
+        Follow.objects.create(user=self.user_1, author=self.user_2)
+        Follow.objects.create(user=reader, author=self.user_2)
+        Follow.objects.create(user=self.user_1, author=reader)
+        cache.clear()
+        posts = [
+            Post.objects.create(
+                author=(self.user_2, reader)[number % 2],
+                text=f'Пост {number}',
+            )
+            for number in range(8)
+        ]
+        url = reverse('posts:follow_index')
+        seen, query = [], {}
+        while query is not None:
+            page = self.authorized_client.get(url, query).context['page_obj']
+            seen += page.object_list
+            query = {'after': page.next_cursor} if page.next_cursor else None
+        self.assertEqual(seen, posts[::-1])
+        cache.clear()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='reader')
+        cls.rare = Post.objects.create(
+            author=cls.user, text='Морские котики живут на севере'
+        )
+        cls.often = Post.objects.create(
+            author=cls.user, text='Котик, котики и снова котиков много'
+        )
+        Post.objects.create(author=cls.user, text='Совсем другая запись')
+
+    def search(self, **params):
+        return self.client.get(reverse('posts:search'), params)
+
+    def test_search_finds_word_forms_by_rank(self):
+        """Поиск находит другие формы слова, частые совпадения выше."""
+        response = self.search(q='котика')
+        self.assertEqual(
+            list(response.context['page_obj'].object_list),
+            [self.often, self.rare],
+        )
+
+    def test_search_index_follows_edit_and_delete(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.create(author=self.user, text='черновик')
+        post.text = 'опубликованная статья'
+        post.save(update_fields=['text'])
+        self.assertFalse(self.search(q='черновик').context['page_obj'])
+        page_obj = self.search(q='статьи', order='date').context['page_obj']
+        self.assertEqual(list(page_obj.object_list), [post])
+        post.delete()
+        self.assertFalse(self.search(q='статья').context['page_obj'])
+
+    def test_search_works_before_index_is_filled(self):
+        """Пока индекс не заполнен после миграции, поиск идёт без него."""
+        fulltext.get_backend().clear()
+        response = self.search(q='котики')
+        self.assertEqual(
+            list(response.context['page_obj'].object_list),
+            [self.often, self.rare],
+        )
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertFalse(fulltext.get_backend().is_empty())
+
+    def test_search_pages_keep_query(self):
+        """Ссылки пагинатора сохраняют поисковый запрос."""
+        for number in range(POSTS_OF_PAGE):
+            Post.objects.create(author=self.user, text=f'котик {number}')
+        response = self.search(q='котик')
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%82%D0%B8%D0%BA')
+        self.assertEqual(
+            len(self.search(q='котик', page=2).context['page_obj']), 2
+        )
+
+
+class CommentThreadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='commenter')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def reply(self, text, parent=None):
+        self.client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': text, 'parent': parent.pk if parent else ''},
+        )
+        return Comment.objects.get(text=text)
+
+    def test_replies_are_threaded_under_root(self):
+        """Ответы попадают в ветку корня в порядке обхода дерева."""
+        root = self.reply('корень')
+        first = self.reply('ответ', root)
+        nested = self.reply('ответ на ответ', first)
+        second = self.reply('второй ответ', root)
+        self.assertEqual(nested.thread_id, root.pk)
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        comments = response.context['comments']
+        self.assertEqual(comments, [root])
+        self.assertEqual(comments[0].thread_replies, [first, nested, second])
+        self.assertEqual(
+            [reply.indent for reply in comments[0].thread_replies],
+            [1, 2, 1],
+        )
+
+    @override_settings(REPLIES_OF_THREAD=2)
+    def test_long_thread_loads_more_replies_by_cursor(self):
+        """Ветка показывает первые ответы, остальные — по курсору."""
+        root = self.reply('корень')
+        first = self.reply('ответ', root)
+        nested = self.reply('ответ на ответ', first)
+        deepest = self.reply('ещё глубже', nested)
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        comment = response.context['comments'][0]
+        self.assertEqual(comment.thread_replies, [first, nested])
+        self.assertIsNotNone(comment.replies_cursor)
+        fragment = self.client.get(
+            reverse('posts:comment_replies', args=(self.post.pk, root.pk)),
+            {'after': comment.replies_cursor},
+        )
+        self.assertTemplateUsed(fragment, 'posts/includes/replies.html')
+        self.assertEqual(fragment.context['replies'], [deepest])
+        self.assertEqual(fragment.context['replies'][0].indent, 3)
+        self.assertIsNone(fragment.context['next_cursor'])
+
+    @override_settings(COMMENTS_OF_PAGE=2)
+    def test_comments_load_by_cursor_fragment(self):
+        """Следующие комментарии отдаются фрагментом по курсору."""
+        for number in range(3):
+            self.reply(f'комментарий {number}')
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        page = response.context['comments_page']
+        self.assertEqual(len(page.object_list), 2)
+        fragment = self.client.get(
+            reverse('posts:comment_list', args=(self.post.pk,)),
+            {'after': page.next_cursor},
+        )
+        self.assertTemplateUsed(fragment, 'posts/includes/comments.html')
+        self.assertEqual(
+            [comment.text for comment in fragment.context['comments']],
+            ['комментарий 0'],
+        )
+
+
+class FollowGraphTest(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create(username='reader')
+        self.authors = [
+            User.objects.create(username=f'author_{num}') for num in range(3)
+        ]
+        cache.clear()
+
+    def test_follow_many_updates_timeline_and_counters(self):
+        """Массовая подписка заполняет ленту и сдвигает счётчики."""
+        post = Post.objects.create(author=self.authors[0], text='пост')
+        ids = [author.pk for author in self.authors] + [self.reader.pk]
+        self.assertEqual(follow_graph.follow_many(self.reader, ids), 3)
+        self.assertEqual(follow_graph.follow_many(self.reader, ids), 0)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.reader.stats.refresh_from_db()
+        self.assertEqual(self.reader.stats.following_count, 3)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.authors[0]).followers_count, 1
+        )
+        following, cursor = follow_graph.following(self.reader, limit=2)
+        self.assertEqual(following, self.authors[:0:-1])
+        rest, cursor = follow_graph.following(
+            self.reader, after=cursor, limit=2
+        )
+        self.assertEqual((rest, cursor), ([self.authors[0]], None))
+        follow_graph.unfollow_many(self.reader, ids)
+        self.assertFalse(Follow.objects.filter(user=self.reader).exists())
+
+    def test_suggestions_are_friends_of_friends(self):
+        """Рекомендуются авторы подписок, на которых ещё нет подписки."""
+        friend, popular, known = self.authors
+        other = User.objects.create(username='other')
+        follow_graph.follow_many(self.reader, [friend.pk, known.pk])
+        follow_graph.follow_many(friend, [popular.pk, known.pk])
+        follow_graph.follow_many(known, [popular.pk, other.pk])
+        self.assertEqual(follow_graph.suggestions(self.reader), [])
+        call_command('compute_suggestions', stdout=StringIO())
+        # Результат команды хранится в базе, а не в кеше процесса
+        cache.clear()
+        self.assertEqual(
+            follow_graph.suggestions(self.reader), ['author_1', 'other']
+        )
+
+    def test_follow_many_counts_inserted_rows(self):
+        """Подписка, уже вставленная без счётчиков, их не сдвигает."""
+        first = self.authors[0]
+        # Так выглядит подписка параллельного запроса: строка есть,
+        # счётчики ещё не сдвинуты
+        Follow.objects.bulk_create([Follow(user=self.reader, author=first)])
+        ids = [author.pk for author in self.authors]
+        self.assertEqual(follow_graph.follow_many(self.reader, ids), 2)
+        self.assertFalse(
+            AuthorStats.objects.filter(user=first, followers_count__gt=0)
+        )
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.authors[1]).followers_count, 1
+        )
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='exporter')
+        cls.author = User.objects.create(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='export', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Мой пост', group=cls.group
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.user, text='Мой комментарий'
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_export_streams_own_content(self):
+        """Выгрузка пользователя отдаётся потоком построчно."""
+        response = self.client.get(reverse('posts:export_profile'))
+        self.assertTrue(response.streaming)
+        records = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [record['kind'] for record in records],
+            ['post', 'comment', 'follow'],
+        )
+        self.assertEqual(records[0]['group'], self.group.slug)
+        self.assertEqual(records[2]['author'], self.author.username)
+
+    def test_export_group_as_csv(self):
+        """Посты группы выгружаются в CSV, гостя просят войти."""
+        url = reverse('posts:export_group', args=(self.group.slug,))
+        response = self.client.get(url, {'format': 'csv'})
+        rows = list(csv.DictReader(
+            b''.join(response.streaming_content).decode().splitlines()
+        ))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual([row['text'] for row in rows], [self.post.text])
+        self.client.logout()
+        self.assertRedirects(
+            self.client.get(url), f'/auth/login/?next={url}'
+        )
+
+
+class QueryBudgetTest(TestCase):
+    """Число запросов ленты не зависит от числа постов на странице."""
+    # Кеш пуст: подписки зрителя загружаются одним запросом на страницу
+    BUDGETS = {
+        'posts:index': 4,
+        'posts:group_list': 4,
+        'posts:profile': 6,
+        # Рекомендации читаются из таблицы по первичному ключу
+        'posts:follow_index': 5,
+        # Валидатор условного GET читает счётчик автора без текста поста
+        'posts:post_detail': 6,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Заголовок',
+            slug='test-link',
+            description='Описание',
+        )
+        for num in range(POSTS_OF_PAGE):
+            author = User.objects.create(username=f'author_{num}')
+            Follow.objects.create(user=cls.reader, author=author)
+            cls.post = Post.objects.create(
+                author=author,
+                text=f'posts #{num}',
+                group=cls.group,
+            )
+            Comment.objects.bulk_create([
+                Comment(post=cls.post, author=author, text='comment'),
+                Comment(post=cls.post, author=cls.reader, text='comment'),
+            ])
+        cls.urls = {
+            'posts:index': reverse('posts:index'),
+            'posts:group_list': reverse(
+                'posts:group_list', args=[cls.group.slug]
+            ),
+            'posts:profile': reverse(
+                'posts:profile', args=[cls.post.author.username]
+            ),
+            'posts:follow_index': reverse('posts:follow_index'),
+            'posts:post_detail': reverse(
+                'posts:post_detail', args=[cls.post.pk]
+            ),
+        }
+
+    def setUp(self) -> None:
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def assertQueryBudget(self, url, budget):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertLessEqual(
+            len(queries), budget,
+            '\n'.join(query['sql'] for query in queries.captured_queries),
+        )
+
+    def test_follow_buttons_use_cached_follow_set(self):
+        """Кнопки подписки на карточках не добавляют запросов."""
+        self.client.get(self.urls['posts:index'])
+        response = self.client.get(self.urls['posts:group_list'])
+        self.assertContains(response, 'Отписаться', count=POSTS_OF_PAGE)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.urls['posts:index'])
+        self.assertEqual(len(queries), 2)
+
+    def test_feed_views_fit_query_budget(self):
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(name=name):
+                self.assertQueryBudget(self.urls[name], budget)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='conditional', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def assertNotModified(self, url, etag):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertFalse(any(
+            '"posts_post"."text"' in query['sql']
+            for query in queries.captured_queries
+        ))
+        return response
+
+    def test_unchanged_pages_are_not_modified(self):
+        """Без изменений страницы отвечают 304, не читая посты."""
+        urls = [
+            reverse('posts:post_detail', args=(self.post.pk,)),
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:group_list', args=(self.group.slug,)),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.client.get(url)
+                response = self.client.get(url)
+                self.assertIn('private', response['Cache-Control'])
+                self.assertIn('Last-Modified', response)
+                self.assertNotModified(url, response['ETag'])
+
+    def test_comment_and_new_post_change_etag(self):
+        detail = reverse('posts:post_detail', args=(self.post.pk,))
+        profile = reverse('posts:profile', args=(self.author.username,))
+        etags = {
+            url: self.client.get(url)['ETag'] for url in (detail, profile)
+        }
+        Comment.objects.create(post=self.post, author=self.reader, text='К')
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etags[detail])
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.client.get(profile, HTTP_IF_NONE_MATCH=etags[profile])
+        self.assertContains(response, 'Новый пост')
+
+    def test_etag_depends_on_viewer(self):
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class LiveUpdatesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='live', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост {number}')
+            for number in range(3)
+        ]
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def stream(self, post):
+        """Тело потока событий до первого поста; пост публикуется
+        после подписки соединения."""
+        sent = []
+
+        async def run():
+            done = asyncio.Event()
+
+            async def receive():
+                await done.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if b'event: post' in message.get('body', b''):
+                    done.set()
+
+            scope = {'type': 'http', 'path': '/events/', 'headers': []}
+            task = asyncio.ensure_future(live.events(scope, receive, send))
+            while len(sent) < 2:
+                await asyncio.sleep(0.01)
+            live.broker.publish(live.post_channels(post), {'id': post.pk})
+            await asyncio.wait_for(task, 5)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertEqual(sent[0]['status'], HTTPStatus.OK)
+        return b''.join(message.get('body', b'') for message in sent[1:])
+
+    def test_new_post_is_pushed(self):
+        body = self.stream(self.posts[0])
+        self.assertIn(
+            f'id: {self.posts[0].pk}\nevent: post\n'.encode(), body
+        )
+        self.assertEqual(live.broker._channels, {})
+
+    def test_resolve_channels_and_missed_posts(self):
+        channels, missed = live.resolve(
+            {'group': 'live'}, {}, str(self.posts[0].pk)
+        )
+        self.assertEqual(channels, [f'group:{self.group.pk}'])
+        self.assertEqual(missed, [])
+        self.client.force_login(self.reader)
+        cookies = {
+            settings.SESSION_COOKIE_NAME: self.client.session.session_key
+        }
+        channels, missed = live.resolve(
+            {'following': '1'}, cookies, str(self.posts[0].pk)
+        )
+        self.assertEqual(channels, [f'author:{self.author.pk}'])
+        self.assertEqual(missed, [post.pk for post in self.posts[1:]])
+        with self.assertRaises(live.StreamError):
+            live.resolve({'following': '1'}, {})
+
+    def test_broker_delivers_once_per_subscriber(self):
+        loop = asyncio.new_event_loop()
+        try:
+            both = live.broker.subscribe(loop, ['all', 'group:1'])
+            other = live.broker.subscribe(loop, ['group:2'])
+            live.broker.publish(['all', 'group:1'], {'id': 1})
+            loop.run_until_complete(asyncio.sleep(0))
+            self.assertEqual(both.queue.qsize(), 1)
+            self.assertEqual(other.queue.qsize(), 0)
+        finally:
+            live.broker.unsubscribe(both)
+            live.broker.unsubscribe(other)
+            loop.close()
+
+    def test_feed_pages_subscribe_and_wsgi_stops_client(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'new EventSource')
+        response = self.client.get(reverse('posts:events'))
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
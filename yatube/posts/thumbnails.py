@@ -0,0 +1,190 @@
+"""Заблаговременная генерация миниатюр картинок постов.
+
+Для каждой картинки создаются варианты нескольких ширин в WebP
+(если Pillow собран с libwebp) и JPEG. Шаблоны показывают только уже
+созданные варианты через ``<picture>``/``srcset``, а недостающие
+ставятся в пул потоков, и до их готовности показывается оригинал.
+Внутри запроса миниатюры не создаются никогда; готовые миниатюры
+сбрасывают версию поста, чтобы закешированная карточка с оригиналом
+построилась заново.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import caching
+
+logger = logging.getLogger(__name__)
+
+# Форматы от предпочтительного к запасному. AVIF sorl-thumbnail 12.7
+# записывать не умеет, WebP доступен не в каждой сборке Pillow.
+FORMATS = tuple(
+    (image_format, mime)
+    for image_format, mime in (
+        ('WEBP', 'image/webp'),
+        ('JPEG', 'image/jpeg'),
+    )
+    if image_format != 'WEBP' or features.check('webp')
+)
+
+OPTIONS = {'crop': 'center', 'upscale': True}
+
+# Варианты для карточки ленты и страницы поста: базовый размер
+# из прежних шаблонов, ширины для srcset и атрибут sizes
+VARIANTS = {
+    'card': {
+        'size': (720, 339),
+        'widths': (360, 720, 1080),
+        'sizes': '(max-width: 768px) 100vw, 720px',
+    },
+    'detail': {
+        'size': (960, 339),
+        'widths': (480, 960, 1440),
+        'sizes': '(max-width: 992px) 100vw, 960px',
+    },
+}
+
+PENDING_KEY = 'thumbnails:pending:{}'
+PENDING_TIMEOUT = 60
+
+
+def geometry(variant, width):
+    base_width, base_height = VARIANTS[variant]['size']
+    return f'{width}x{round(width * base_height / base_width)}'
+
+
+def sizes(variants=VARIANTS):
+    """Пары (геометрия, опции) sorl для всех миниатюр вариантов."""
+    return tuple(
+        (geometry(variant, width), dict(OPTIONS, format=image_format))
+        for variant in variants
+        for width in VARIANTS[variant]['widths']
+        for image_format, _ in FORMATS
+    )
+
+
+THUMBNAIL_SIZES = sizes()
+
+
+class ExistingThumbnailBackend(ThumbnailBackend):
+    """Ищет миниатюру в хранилище ключей sorl, не создавая её.
+
+    Публичного поиска без создания в sorl нет, поэтому имя файла
+    строится закрытым ``_get_thumbnail_filename``: версия sorl
+    закреплена в requirements.txt, при её обновлении поиск нужно
+    проверить заново.
+    """
+
+    def lookup(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+_backend = ExistingThumbnailBackend()
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def generate(name, thumbnail_sizes=THUMBNAIL_SIZES):
+    """Создаёт миниатюры для файла картинки из хранилища."""
+    try:
+        if not ImageFile(name).exists():
+            logger.warning('Картинка %s не найдена в хранилище', name)
+            return False
+        for geometry_string, options in thumbnail_sizes:
+            get_thumbnail(name, geometry_string, **options)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+        return False
+    return True
+
+
+def _generate_in_worker(name, post_id):
+    try:
+        created = generate(name)
+        if created:
+            # Карточка с оригиналом закеширована под прежней версией
+            caching.invalidate_post(post_id)
+        return created
+    finally:
+        cache.delete(PENDING_KEY.format(name))
+        # У каждого потока пула своё соединение с базой
+        connection.close()
+
+
+def _submit(name, post_id):
+    if not settings.THUMBNAIL_WORKERS:
+        return
+    if cache.add(PENDING_KEY.format(name), True, PENDING_TIMEOUT):
+        _get_executor().submit(_generate_in_worker, name, post_id)
+
+
+def schedule(post):
+    """Ставит генерацию миниатюр в пул после фиксации транзакции."""
+    if not post.image:
+        return
+    name, post_id = post.image.name, post.pk
+    transaction.on_commit(lambda: _submit(name, post_id))
+
+
+def picture(name, variant):
+    """Источники для ``<picture>`` из готовых миниатюр или None."""
+    spec = VARIANTS[variant]
+    sources = []
+    src = None
+    for image_format, mime in FORMATS:
+        srcset = []
+        for width in spec['widths']:
+            thumbnail = _backend.lookup(
+                name, geometry(variant, width),
+                **dict(OPTIONS, format=image_format)
+            )
+            if thumbnail is None:
+                return None
+            srcset.append(f'{thumbnail.url} {width}w')
+            if width == spec['size'][0]:
+                src = thumbnail.url
+        sources.append({'type': mime, 'srcset': ', '.join(srcset)})
+    return {
+        'sources': sources[:-1],
+        'srcset': sources[-1]['srcset'],
+        'src': src,
+        'sizes': spec['sizes'],
+    }
+
+
+def picture_or_schedule(name, variant, post_id):
+    """Готовые варианты картинки или None; недостающие ставит в пул.
+
+    Без пула потоков (``THUMBNAIL_WORKERS = 0``) миниатюры создаёт
+    только команда ``warm_thumbnails``.
+    """
+    result = picture(name, variant)
+    if result is None:
+        _submit(name, post_id)
+    return result
@@ -0,0 +1,220 @@
+"""Материализованная лента подписок (fan-out-on-write).
+
+Новый пост сразу раскладывается по лентам подписчиков автора,
+поэтому ``follow_index`` читает одну таблицу по индексу
+``(user, -pub_date, -post)``. Авторы с огромным числом подписчиков
+не раскладываются: их посты подмешиваются в ленту при чтении.
+Длина ленты хранится в ``AuthorStats.timeline_length`` как оценка
+сверху, и после раскладки обрезаются только ленты длиннее
+``TIMELINE_MAX_LENGTH``.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .paginators import KeysetPaginator
+
+CELEBRITIES_CACHE_KEY = 'timeline:celebrities'
+CELEBRITIES_CACHE_TIMEOUT = 5 * 60
+BATCH_SIZE = 500
+# Раскладка обрезает переполненную ленту до этой доли длины, чтобы
+# следующие посты не обрезали её каждый раз
+TRIM_TO = 0.9
+
+
+def celebrity_ids():
+    """Авторы, чьи посты отдаются в ленту при чтении."""
+    ids = cache.get(CELEBRITIES_CACHE_KEY)
+    if ids is None:
+        ids = frozenset(
+            Follow.objects.values('author')
+            .annotate(followers=Count('id'))
+            .filter(followers__gte=settings.TIMELINE_FANOUT_LIMIT)
+            .values_list('author', flat=True)
+        )
+        cache.set(CELEBRITIES_CACHE_KEY, ids, CELEBRITIES_CACHE_TIMEOUT)
+    return ids
+
+
+def _entry(user_id, post):
+    return TimelineEntry(
+        user_id=user_id,
+        post_id=post.pk,
+        author_id=post.author_id,
+        pub_date=post.pub_date,
+    )
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if post.author_id in celebrity_ids():
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (_entry(user_id, post) for user_id in followers.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    readers = AuthorStats.objects.filter(user_id__in=followers)
+    readers.update(timeline_length=F('timeline_length') + 1)
+    overflow = readers.filter(
+        timeline_length__gt=settings.TIMELINE_MAX_LENGTH
+    ).values_list('user_id', flat=True)
+    for user_id in overflow:
+        trim(user_id, int(settings.TIMELINE_MAX_LENGTH * TRIM_TO))
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты нового автора подписки."""
+    if author_id in celebrity_ids():
+        return
+    posts = Post.objects.filter(author_id=author_id).only(
+        'pk', 'author_id', 'pub_date'
+    )[:settings.TIMELINE_MAX_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        (_entry(user_id, post) for post in posts),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(user_id)
+
+
+def fill(user_id):
+    """Заполняет пустую ленту последними постами всех подписок.
+
+    Один INSERT ... SELECT вместо ``backfill`` по каждому автору: строки
+    не проходят через Python, а в ленту попадают только посты, которые
+    останутся после обрезки.
+    """
+    authors = Follow.objects.filter(user_id=user_id).exclude(
+        author_id__in=celebrity_ids()
+    ).values('author_id')
+    posts = Post.objects.filter(author_id__in=authors).order_by(
+        '-pub_date', '-pk'
+    ).values('pk', 'author_id', 'pub_date')[:settings.TIMELINE_MAX_LENGTH]
+    sql, params = posts.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TimelineEntry._meta.db_table} '
+            '(user_id, post_id, author_id, pub_date) '
+            'SELECT %s, latest.id, latest.author_id, latest.pub_date '
+            f'FROM ({sql}) latest',
+            [user_id, *params],
+        )
+    _store_length(user_id)
+
+
+def remove_author(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    deleted, _ = TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).delete()
+    if deleted:
+        AuthorStats.objects.filter(
+            user_id=user_id, timeline_length__gte=deleted
+        ).update(timeline_length=F('timeline_length') - deleted)
+
+
+def trim(user_id, length=None):
+    """Оставляет в ленте не больше ``length`` записей (по умолчанию
+    TIMELINE_MAX_LENGTH)."""
+    length = length or settings.TIMELINE_MAX_LENGTH
+    border = TimelineEntry.objects.filter(user_id=user_id).order_by(
+        '-pub_date', '-post_id'
+    ).values_list('pub_date', flat=True)[length:length + 1]
+    border = list(border)
+    if border:
+        TimelineEntry.objects.filter(
+            user_id=user_id, pub_date__lte=border[0]
+        ).delete()
+    _store_length(user_id)
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя в одной транзакции: читатель
+    не видит её пустой."""
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        fill(user_id)
+
+
+def _store_length(user_id):
+    AuthorStats.objects.filter(user_id=user_id).update(
+        timeline_length=TimelineEntry.objects.filter(
+            user_id=user_id
+        ).count()
+    )
+
+
+class TimelinePaginator(KeysetPaginator):
+    """Страницы ленты подписок по индексу ``TimelineEntry``.
+
+    Записи ленты читаются по ``(user, -pub_date, -post)`` вместе с
+    постами одним запросом. Посты каждой знаменитости из подписок
+    берутся тем же курсором по индексу ``(author, -pub_date, -id)``
+    отдельным запросом и сливаются с записями ленты: общий запрос по
+    нескольким авторам сортировал бы все их посты.
+    """
+    key_field = 'post_id'
+
+    def __init__(self, user, per_page, celebrity_posts=(), **kwargs):
+        entries = TimelineEntry.objects.filter(user=user).select_related(
+            'post__author', 'post__group'
+        )
+        super().__init__(entries, per_page, **kwargs)
+        self.sources = [self] + [
+            KeysetPaginator(posts, per_page) for posts in celebrity_posts
+        ]
+
+    def _merge(self, querysets, descending=True, limit=None):
+        limit = limit or self.per_page + 1
+        posts = {}
+        for queryset in querysets:
+            for row in queryset[:limit]:
+                post = row.post if isinstance(row, TimelineEntry) else row
+                posts[post.pk] = post
+        return sorted(
+            posts.values(),
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=descending,
+        )[:limit]
+
+    def _fetch_after(self, date, pk):
+        return self._merge([
+            source._after(date, pk)
+            for source in self.sources
+        ])
+
+    def _fetch_before(self, date, pk):
+        return self._merge([
+            source._before(date, pk)
+            for source in self.sources
+        ], descending=False)
+
+    def _fetch_slice(self, offset):
+        limit = offset + self.per_page + 1
+        return self._merge(
+            [source.object_list for source in self.sources], limit=limit
+        )[offset:]
+
+
+def feed_page(user, params):
+    """Страница ленты подписок пользователя по параметрам запроса."""
+    celebrity_posts = []
+    celebrities = celebrity_ids()
+    if celebrities:
+        followed = Follow.objects.filter(
+            user=user, author_id__in=celebrities
+        ).values_list('author_id', flat=True)
+        celebrity_posts = [
+            Post.objects.filter(author_id=author_id).for_feed()
+            for author_id in followed
+        ]
+    paginator = TimelinePaginator(
+        user, settings.POSTS_OF_PAGE, celebrity_posts
+    )
+    return paginator.get_page(params)
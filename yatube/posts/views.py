@@ -1,81 +1,246 @@
-from django.core.paginator import Paginator
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.views.decorators.http import require_POST
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 from django.contrib.auth.decorators import login_required
 
+from core.conditional import conditional
+from core.routers import pin_to_primary, replica_reads
+
+from . import (
+    caching, comment_buffer, comments, counters, exporting, follow_graph,
+    fulltext, thumbnails, timeline,
+)
 from .forms import CommentForm, PostForm
 
-from .models import Group, Post, User, Follow, Comment
+from .models import Group, Post, User, Comment
+from .paginators import KeysetPaginator
 
 from yatube.settings import POSTS_OF_PAGE
 
 
 def paginator_func(request, posts):
-    paginator = Paginator(posts, POSTS_OF_PAGE)
-    page_obj = paginator.get_page(request.GET.get('page'))
-    return page_obj
+    paginator = KeysetPaginator(posts, POSTS_OF_PAGE)
+    page_obj = paginator.get_page(request.GET)
+    return caching.with_card_versions(page_obj)
+
+
+def _viewer(request):
+    """Части ETag, зависящие от зрителя: шапка, кнопки подписки и
+    CSRF-токен в формах страницы."""
+    csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    if not request.user.is_authenticated:
+        return ['anon', csrf], []
+    version = caching.follow_version(request.user.pk)
+    return [request.user.pk, version, csrf], [version]
+
+
+def _validators(request, parts, versions):
+    viewer_parts, viewer_versions = _viewer(request)
+    versions = [*versions, *viewer_versions]
+    return (
+        [*viewer_parts, *parts, *versions],
+        caching.last_changed(versions),
+    )
+
+
+def _group_for_request(request, slug):
+    """Группа, загруженная не больше раза за запрос."""
+    if not hasattr(request, '_group'):
+        request._group = get_object_or_404(Group, slug=slug)
+    return request._group
+
+
+def _author_for_request(request, username):
+    if not hasattr(request, '_author'):
+        request._author = get_object_or_404(
+            User.objects.select_related('stats'), username=username
+        )
+    return request._author
+
+
+def group_validators(request, slug):
+    """Версия группы и карточек закешированной страницы.
+
+    Без страницы в кеше валидаторов нет: она строится как обычно.
+    """
+    group = _group_for_request(request, slug)
+    version = caching.group_version(group.pk)
+    page_obj = caching.peek_page(request, f'group:{group.pk}', version)
+    if page_obj is None:
+        return None
+    cards = caching.post_versions(post.pk for post in page_obj.object_list)
+    return _validators(request, [], [version, *cards.values()])
+
+
+def profile_validators(request, username):
+    """Счётчики автора и версии карточек страницы.
+
+    id постов страницы читаются одним запросом по индексу
+    (автор, дата, id) без текстов постов.
+    """
+    author = _author_for_request(request, username)
+    stats = counters.stats_for(author)
+    rows = KeysetPaginator(
+        author.posts.values('id', 'pub_date'), POSTS_OF_PAGE
+    ).get_page(request.GET).object_list
+    cards = caching.post_versions(row['id'] for row in rows)
+    return _validators(
+        request,
+        [
+            author.get_full_name(), stats.posts_count,
+            stats.followers_count, stats.following_count,
+        ],
+        [caching.follow_version(author.pk), *cards.values()],
+    )
+
+
+def post_validators(request, post_id):
+    """Версия поста и счётчик постов автора одним запросом по ключу."""
+    rows = list(Post.objects.filter(pk=post_id).values_list(
+        'author__first_name', 'author__last_name',
+        'author__stats__posts_count',
+    ))
+    if not rows:
+        return None
+    return _validators(
+        request, rows[0], [caching.post_versions([post_id])[post_id]]
+    )
 
 
 # Главная страница Yatube соц сети
-@cache_page(20)
+@replica_reads
 def index(request):
-    posts = Post.objects.all()
+    posts = Post.objects.for_feed()
     context = {
         'posts': posts,
-        'page_obj': paginator_func(request, posts),
+        'page_obj': caching.cached_page(
+            request, 'index', lambda: paginator_func(request, posts)
+        ),
     }
     return render(request, 'posts/index.html', context)
 
 
+@replica_reads
+@conditional(group_validators, private=True)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    group = _group_for_request(request, slug)
+    posts = group.posts.for_feed()
     title = Group.__str__
     context = {
         'group': group,
         'title': title,
-        'page_obj': paginator_func(request, posts),
+        'page_obj': caching.cached_page(
+            request,
+            f'group:{group.pk}',
+            lambda: paginator_func(request, posts),
+            caching.group_version(group.pk),
+        ),
         'posts': posts,
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@replica_reads
+@conditional(profile_validators, private=True)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    author = _author_for_request(request, username)
+    posts = author.posts.for_feed()
     if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user,
-            author=author)
+        following = author.pk in follow_graph.followed_for_request(request)
         context = {
             'following': following,
             'page_obj': paginator_func(request, posts),
             'posts': posts,
             'author': author,
+            'stats': counters.stats_for(author),
         }
         return render(request, 'posts/profile.html', context)
     context = {
         'page_obj': paginator_func(request, posts),
         'posts': posts,
         'author': author,
+        'stats': counters.stats_for(author),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@replica_reads
+@conditional(post_validators, private=True)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.for_feed().select_related('author__stats'),
+        pk=post_id,
+    )
     form = CommentForm()
     created = Comment.__str__
-    comments = post.comments.all()
+    comments_page = comments.page_for(post, request.GET)
     context = {
         'post': post,
         'form': form,
-        'comments': comments,
+        'comments': comments_page.object_list,
+        'comments_page': comments_page,
         'created': created,
+        'author_stats': counters.stats_for(post.author),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comment_list(request, post_id):
+    """Следующая страница комментариев фрагментом HTML."""
+    post = get_object_or_404(Post, pk=post_id)
+    comments_page = comments.page_for(post, request.GET)
+    context = {
+        'post': post,
+        'comments': comments_page.object_list,
+        'comments_page': comments_page,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def comment_replies(request, post_id, comment_id):
+    """Следующая пачка ответов ветки фрагментом HTML."""
+    root = get_object_or_404(
+        Comment.objects.select_related('post'),
+        pk=comment_id, post_id=post_id, parent__isnull=True,
+    )
+    replies, next_cursor = comments.more_replies(root, request.GET)
+    context = {
+        'post': root.post,
+        'comment': root,
+        'replies': replies,
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'posts/includes/replies.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    order = 'date' if request.GET.get('order') == 'date' else 'rank'
+    context = {
+        'query': query,
+        'order': order,
+        'page_query': urlencode({'q': query, 'order': order}) + '&',
+    }
+    if query:
+        if order == 'date':
+            posts = fulltext.get_backend().filter(
+                Post.objects.for_feed(), query
+            )
+            page_obj = paginator_func(request, posts)
+        else:
+            page_obj = caching.with_card_versions(fulltext.ranked_page(
+                query, request.GET.get('page'), POSTS_OF_PAGE
+            ))
+        context['page_obj'] = page_obj
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -85,7 +250,10 @@ def post_create(request):
     if request.method == 'POST' and form.is_valid():
         new_post = form.save(commit=False)
         new_post.author = request.user
-        new_post.save()
+        with transaction.atomic():
+            new_post.save()
+            thumbnails.schedule(new_post)
+        pin_to_primary(request.user)
         return redirect('posts:profile', request.user)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -101,7 +269,13 @@ def post_edit(request, post_id):
         instance=post,
     )
     if request.method == 'POST' and form.is_valid():
-        form.save()
+        # Счётчик комментариев не перезаписываем значением из формы
+        post = form.save(commit=False)
+        with transaction.atomic():
+            post.save(update_fields=PostForm.Meta.fields)
+            if 'image' in form.changed_data:
+                thumbnails.schedule(post)
+        pin_to_primary(request.user)
         return redirect('posts:post_detail', post.pk)
     context = {
         'form': form,
@@ -110,39 +284,151 @@ def post_edit(request, post_id):
     return render(request, 'posts/create_post.html', context)
 
 
+def _build_comment(request, post):
+    """Форма и несохранённый комментарий (или None) из POST."""
+    form = CommentForm(request.POST or None)
+    if not form.is_valid():
+        return form, None
+    comment = form.save(commit=False)
+    comment.author = request.user
+    comment.post = post
+    parent_id = request.POST.get('parent', '')
+    parent = Comment.objects.filter(
+        post=post, pk=parent_id
+    ).first() if parent_id.isdigit() else None
+    if parent is not None:
+        comment.parent = parent
+        comment.thread_id = comments.thread_root(parent)
+    return form, comment
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    form = CommentForm(request.POST or None)
-    if form.is_valid():
-        comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = post
-        comment.save()
+    _, comment = _build_comment(request, post)
+    if comment is not None:
+        with transaction.atomic():
+            comment.save()
+        pin_to_primary(request.user)
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@require_POST
+def comment_create(request, post_id):
+    """Создаёт комментарий и отдаёт JSON с его фрагментом HTML."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    form, comment = _build_comment(request, post)
+    if comment is None:
+        return JsonResponse({'errors': form.errors}, status=400)
+    if comment_buffer.enabled():
+        comment.created = timezone.now()
+        comment_buffer.add(comment)
+        status = 202
+    else:
+        with transaction.atomic():
+            comment.save()
+        pin_to_primary(request.user)
+        status = 201
+    html = render_to_string(
+        'posts/includes/comment.html',
+        {'comment': comment, 'post': post},
+        request=request,
+    )
+    return JsonResponse(
+        {'id': comment.pk, 'pending': comment.pk is None, 'html': html},
+        status=status,
+    )
+
+
+@login_required
+@replica_reads
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
+    page_obj = timeline.feed_page(request.user, request.GET)
     context = {
-        'posts': posts,
-        'page_obj': paginator_func(request, posts),
+        'page_obj': caching.with_card_versions(page_obj),
+        'suggestions': follow_graph.suggestions(request.user),
     }
     return render(request, 'posts/follow.html', context)
 
 
+def events(request):
+    # Поток событий обслуживает ASGI-приложение yatube.asgi; под WSGI
+    # ответ 204 говорит EventSource не переподключаться
+    return HttpResponse(status=204)
+
+
+def _follow_list(request, username, load, title):
+    author = get_object_or_404(User, username=username)
+    after = request.GET.get('after', '')
+    users, next_cursor = load(
+        author, after=int(after) if after.isdigit() else None
+    )
+    context = {
+        'author': author,
+        'users': users,
+        'next_cursor': next_cursor,
+        'title': title,
+    }
+    return render(request, 'posts/follow_list.html', context)
+
+
+def followers(request, username):
+    return _follow_list(
+        request, username, follow_graph.followers, 'Подписчики'
+    )
+
+
+def following(request, username):
+    return _follow_list(
+        request, username, follow_graph.following, 'Подписки'
+    )
+
+
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    follow_graph.follow_many(request.user, [author.pk])
+    pin_to_primary(request.user)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    if author != request.user:
-        Follow.objects.filter(user=request.user, author=author).delete()
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    follow_graph.unfollow_many(request.user, [author.pk])
+    pin_to_primary(request.user)
     return redirect('posts:profile', username=username)
+
+
+def _export_response(request, records, name):
+    file_format = request.GET.get('format')
+    if file_format not in exporting.SERIALIZERS:
+        file_format = 'jsonl'
+    serialize, content_type = exporting.SERIALIZERS[file_format]
+    response = StreamingHttpResponse(
+        serialize(records), content_type=f'{content_type}; charset=utf-8'
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{name}.{file_format}"'
+    )
+    return response
+
+
+@login_required
+def export_profile(request):
+    return _export_response(
+        request,
+        exporting.user_records(request.user),
+        f'yatube-{request.user.username}',
+    )
+
+
+@login_required
+def export_group(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return _export_response(
+        request,
+        exporting.group_records(group),
+        f'yatube-group-{group.slug}',
+    )
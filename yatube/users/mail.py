@@ -0,0 +1,210 @@
+"""Очередь исходящих писем.
+
+``OutboxBackend`` — почтовый бэкенд Django: письма регистрации и сброса
+пароля не отправляются внутри запроса, а записываются в таблицу
+``OutboxMessage``. Фоновый поток процесса (или команда
+``send_queued_mail``) забирает их пачками и отправляет бэкендом
+``MAIL_DELIVERY_BACKEND`` через одно соединение на всю очередь.
+Письмо закрепляется за взявшим его воркером, поэтому несколько
+процессов не отправляют его дважды. Неудачная отправка повторяется
+с растущей паузой до ``MAIL_MAX_ATTEMPTS`` раз. Вложения и
+дополнительные заголовки в очередь не попадают.
+"""
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.signals import request_started
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд письмо закреплено за взявшим его воркером
+CLAIM_TIMEOUT = 300
+# Пауза перед первым повтором; каждая следующая вдвое длиннее
+RETRY_DELAY = 60
+
+_wakeup = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _join(addresses):
+    return '\n'.join(addresses)
+
+
+def _split(addresses):
+    return [address for address in addresses.split('\n') if address]
+
+
+def _to_row(message):
+    html = ''
+    for content, mimetype in getattr(message, 'alternatives', ()):
+        if mimetype == 'text/html':
+            html = content
+    return OutboxMessage(
+        subject=message.subject,
+        body=message.body,
+        html_body=html,
+        from_email=message.from_email,
+        to=_join(message.to),
+        cc=_join(message.cc),
+        bcc=_join(message.bcc),
+    )
+
+
+def _to_email(row, mailer):
+    email = EmailMultiAlternatives(
+        row.subject, row.body, row.from_email, _split(row.to),
+        cc=_split(row.cc), bcc=_split(row.bcc), connection=mailer,
+    )
+    if row.html_body:
+        email.attach_alternative(row.html_body, 'text/html')
+    return email
+
+
+class OutboxBackend(BaseEmailBackend):
+    """Записывает письма в очередь вместо отправки."""
+
+    def send_messages(self, email_messages):
+        rows = [
+            _to_row(message) for message in email_messages
+            if message.recipients()
+        ]
+        OutboxMessage.objects.bulk_create(rows)
+        if rows and settings.MAIL_WORKER:
+            transaction.on_commit(wake)
+        return len(rows)
+
+
+def _pending():
+    return OutboxMessage.objects.filter(
+        sent__isnull=True, attempts__lt=settings.MAIL_MAX_ATTEMPTS,
+    ).filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lte=timezone.now())
+    )
+
+
+def claim(batch_size):
+    """Закрепляет за воркером до ``batch_size`` писем и возвращает их."""
+    ids = list(_pending().values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Условие очереди проверяется ещё раз в UPDATE: письма, которые
+    # успел взять другой воркер, не обновятся
+    _pending().filter(pk__in=ids).update(
+        claim=token,
+        locked_until=timezone.now() + timedelta(seconds=CLAIM_TIMEOUT),
+    )
+    return list(OutboxMessage.objects.filter(claim=token))
+
+
+def _fail(rows, error):
+    logger.warning('Не удалось отправить писем: %s (%s)', len(rows), error)
+    for row in rows:
+        delay = RETRY_DELAY * 2 ** row.attempts
+        OutboxMessage.objects.filter(pk=row.pk).update(
+            attempts=F('attempts') + 1,
+            last_error=str(error),
+            claim='',
+            locked_until=timezone.now() + timedelta(seconds=delay),
+        )
+
+
+def deliver(batch_size=None, mailer=None):
+    """Отправляет пачку писем из очереди, возвращает (отправлено, ошибок).
+
+    ``mailer`` — соединение бэкенда отправки, общее для нескольких
+    пачек; без него соединение открывается на одну пачку.
+    """
+    batch = claim(batch_size or settings.MAIL_BATCH_SIZE)
+    if not batch:
+        return 0, 0
+    own = mailer is None
+    if own:
+        mailer = get_connection(settings.MAIL_DELIVERY_BACKEND)
+    sent, failed = [], 0
+    try:
+        try:
+            mailer.open()
+        except Exception as error:
+            _fail(batch, error)
+            return 0, len(batch)
+        for row in batch:
+            try:
+                _to_email(row, mailer).send()
+            except Exception as error:
+                _fail([row], error)
+                failed += 1
+            else:
+                sent.append(row.pk)
+    finally:
+        if own:
+            mailer.close()
+    OutboxMessage.objects.filter(pk__in=sent).update(
+        sent=timezone.now(), claim='', locked_until=None
+    )
+    return len(sent), failed
+
+
+def drain(batch_size=None):
+    """Отправляет всю очередь пачками через одно соединение."""
+    total = errors = 0
+    mailer = get_connection(settings.MAIL_DELIVERY_BACKEND)
+    try:
+        while True:
+            sent, failed = deliver(batch_size, mailer)
+            total += sent
+            errors += failed
+            # Пустая очередь или ни одно письмо пачки не ушло
+            if not sent:
+                break
+    finally:
+        mailer.close()
+    return total, errors
+
+
+def _run():
+    while True:
+        _wakeup.wait(settings.MAIL_POLL_INTERVAL)
+        _wakeup.clear()
+        try:
+            drain()
+        except Exception:
+            logger.exception('Сбой отправки очереди писем')
+        finally:
+            # У фонового потока своё соединение с базой
+            connection.close()
+
+
+def wake():
+    """Будит фоновый поток отправки, при необходимости запуская его."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_run, name='mail-outbox', daemon=True
+            )
+            _worker.start()
+    _wakeup.set()
+
+
+def start_worker(**kwargs):
+    """Запускает поток с первым запросом веб-процесса.
+
+    Письма, оставшиеся в очереди после перезапуска, уходят сразу, не
+    дожидаясь нового письма. Команды ``manage.py`` запросов
+    не обслуживают и поток не запускают.
+    """
+    if settings.MAIL_WORKER:
+        request_started.disconnect(start_worker)
+        wake()
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from users import mail
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди исходящей почты.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, help='писем в пачке'
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='не завершаться, а проверять очередь каждые --interval с'
+        )
+        parser.add_argument('--interval', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = mail.drain(options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Отправлено писем: {sent}, ошибок: {failed}'
+                ))
+            if not options['loop']:
+                return
+            connection.close_if_unusable_or_obsolete()
+            time.sleep(options['interval'])
@@ -0,0 +1,114 @@
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from users import mail as outbox
+from users.models import OutboxMessage
+
+User = get_user_model()
+
+LOCMEM_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+
+class CountingBackend(locmem.EmailBackend):
+    connections = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        CountingBackend.connections += 1
+
+
+class FailingOpenBackend(locmem.EmailBackend):
+    closed = 0
+
+    def open(self):
+        raise ConnectionRefusedError('SMTP недоступен')
+
+    def close(self):
+        FailingOpenBackend.closed += 1
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('SMTP недоступен')
+
+
+@override_settings(
+    EMAIL_BACKEND='users.mail.OutboxBackend',
+    MAIL_DELIVERY_BACKEND=LOCMEM_BACKEND,
+    MAIL_WORKER=False,
+)
+class OutboxTest(TestCase):
+    def test_signup_email_is_queued_not_sent(self):
+        """Письмо регистрации встаёт в очередь и уходит из воркера."""
+        self.client.post(reverse('users:signup'), {
+            'username': 'reader',
+            'email': 'reader@example.com',
+            'password1': 'Sup3r-secret-pass',
+            'password2': 'Sup3r-secret-pass',
+        })
+        self.assertEqual(mail.outbox, [])
+        queued = OutboxMessage.objects.get()
+        self.assertEqual(queued.to, 'reader@example.com')
+        self.assertIn('reader', queued.body)
+
+        self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['reader@example.com'])
+        queued.refresh_from_db()
+        self.assertIsNotNone(queued.sent)
+        self.assertEqual(outbox.drain(), (0, 0))
+
+    def test_password_reset_email_is_queued(self):
+        User.objects.create_user('reader', 'reader@example.com', 'pass')
+        response = self.client.post(
+            reverse('users:password_reset_form'),
+            {'email': 'reader@example.com'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(
+            OutboxMessage.objects.get().to, 'reader@example.com'
+        )
+
+    def test_batch_is_sent_over_one_connection(self):
+        mail.send_mass_mail([
+            ('Тема', 'Текст', None, [f'user{number}@example.com'])
+            for number in range(5)
+        ])
+        CountingBackend.connections = 0
+        with self.settings(
+            MAIL_DELIVERY_BACKEND='users.tests.CountingBackend'
+        ):
+            self.assertEqual(outbox.drain(batch_size=2), (5, 0))
+        self.assertEqual(CountingBackend.connections, 1)
+        self.assertEqual(len(mail.outbox), 5)
+
+    @override_settings(MAIL_DELIVERY_BACKEND='users.tests.FailingBackend')
+    def test_failed_message_is_retried_later(self):
+        mail.send_mail('Тема', 'Текст', None, ['reader@example.com'])
+        self.assertEqual(outbox.drain(), (0, 1))
+        queued = OutboxMessage.objects.get()
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('SMTP', queued.last_error)
+        self.assertIsNone(queued.sent)
+        # До конца паузы письмо не берётся снова
+        self.assertEqual(outbox.claim(10), [])
+
+    @override_settings(
+        MAIL_DELIVERY_BACKEND='users.tests.FailingOpenBackend'
+    )
+    def test_connection_is_closed_when_open_fails(self):
+        """Своё соединение закрывается, даже если не открылось."""
+        mail.send_mail('Тема', 'Текст', None, ['reader@example.com'])
+        FailingOpenBackend.closed = 0
+        self.assertEqual(outbox.deliver(), (0, 1))
+        self.assertEqual(FailingOpenBackend.closed, 1)
+
+    def test_claimed_message_is_not_taken_twice(self):
+        mail.send_mail('Тема', 'Текст', None, ['reader@example.com'])
+        self.assertEqual(len(outbox.claim(10)), 1)
+        self.assertEqual(outbox.claim(10), [])
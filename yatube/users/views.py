@@ -1,21 +1,31 @@
 from django.views.generic import CreateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.core.mail import send_mail
+from django.template.loader import render_to_string
 
 from .forms import CreationForm, User
 
 
-send_mail(
-    'Тема письма',
-    'Текст письма.',
-    'from@example.com',  # Это поле "От кого"
-    ['to@example.com'],  # Это поле "Кому" (можно указать список адресов)
-    fail_silently=False,  # Сообщать об ошибках («молчать ли об ошибках?»)
-)
-
-
 class SignUp(CreateView):
     model = User
     form_class = CreationForm
     success_url = reverse_lazy('posts:index')
     template_name = 'users/signup.html'
+
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        user = self.object
+        if user.email:
+            # Письмо только встаёт в очередь, отправляет его фоновый воркер
+            send_mail(
+                'Регистрация на Yatube',
+                render_to_string('users/signup_email.txt', {
+                    'user': user,
+                    'login_url': self.request.build_absolute_uri(
+                        reverse('users:login')
+                    ),
+                }),
+                None,
+                [user.email],
+            )
+        return response
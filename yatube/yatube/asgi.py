@@ -0,0 +1,17 @@
+import os
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+wsgi_application = get_wsgi_application()
+
+from core.asgi import WsgiToAsgi, router  # noqa: E402
+from posts import live  # noqa: E402
+
+application = router(
+    {reverse('posts:events'): live.events},
+    WsgiToAsgi(wsgi_application, workers=settings.ASGI_THREADS),
+)
@@ -11,7 +11,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = '$j#(7pku^v6)&u4m4&k2q#y7o(gum(v!qs%wq8g3y!jghzm+o='
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('YATUBE_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = [
     'localhost',
@@ -34,11 +34,13 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
     'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,10 +57,13 @@ INTERNAL_IPS = [
 
 ROOT_URLCONF = 'yatube.urls'
 
+# Тесты запускаются без фоновых потоков миниатюр, рекомендаций и почты
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -68,6 +73,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.follows.follows',
             ],
         },
     },
@@ -79,12 +85,84 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# Движок базы: sqlite (одна машина) или postgresql
+DB_ENGINE = os.getenv('YATUBE_DB_ENGINE', 'sqlite')
+
+# Сколько секунд соединение живёт между запросами (0 — закрывать сразу)
+DB_CONN_MAX_AGE = int(os.getenv('YATUBE_DB_CONN_MAX_AGE', 60))
+
+# Размер пула соединений процесса для PostgreSQL (0 — без пула)
+DB_POOL_SIZE = int(os.getenv('YATUBE_DB_POOL_SIZE', 0))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': (
+                'core.backends.postgresql_pool' if DB_POOL_SIZE
+                else 'django.db.backends.postgresql'
+            ),
+            'NAME': os.getenv('YATUBE_DB_NAME', 'yatube'),
+            'USER': os.getenv('YATUBE_DB_USER', 'yatube'),
+            'PASSWORD': os.getenv('YATUBE_DB_PASSWORD', ''),
+            'HOST': os.getenv('YATUBE_DB_HOST', 'localhost'),
+            'PORT': os.getenv('YATUBE_DB_PORT', '5432'),
+            # Соединения переиспользует пул, а не Django
+            'CONN_MAX_AGE': 0 if DB_POOL_SIZE else DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                'pool': {'min': 1, 'max': DB_POOL_SIZE},
+            } if DB_POOL_SIZE else {},
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'core.backends.sqlite3',
+            'NAME': os.getenv(
+                'YATUBE_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')
+            ),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Сколько секунд ждать снятия блокировки записи
+                'timeout': 20,
+                # WAL: читатели не ждут писателя; при WAL режим NORMAL
+                # не теряет целостность, только последние транзакции
+                # при отключении питания. Режим журнала хранится в файле,
+                # поэтому без WAL он возвращается явно
+                'pragmas': {
+                    'journal_mode': 'WAL',
+                    'synchronous': 'NORMAL',
+                    'mmap_size': int(
+                        os.getenv('YATUBE_SQLITE_MMAP_SIZE', 256 * 1024 ** 2)
+                    ),
+                } if os.getenv('YATUBE_SQLITE_WAL', '1') == '1' else {
+                    'journal_mode': 'DELETE',
+                },
+            },
+        }
+    }
+
+# Реплики только для чтения через запятую: пути к файлам SQLite или хосты
+# PostgreSQL. С них читают ленты, профиль и страница поста
+DB_REPLICAS = [
+    location for location in os.getenv('YATUBE_DB_REPLICAS', '').split(',')
+    if location
+]
+
+REPLICA_DATABASES = []
+for number, location in enumerate(DB_REPLICAS, 1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST' if DB_ENGINE == 'postgresql' else 'NAME': location,
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Сколько секунд после записи пользователь читает с основной базы;
+# не меньше отставания реплик
+REPLICA_LAG = int(os.getenv('YATUBE_DB_REPLICA_LAG', 5))
 
 
 # Password validation
@@ -136,23 +214,122 @@ LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
 
 
-#  подключаем движок filebased.EmailBackend
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# Письма не отправляются из запроса, а встают в очередь users.OutboxMessage
+EMAIL_BACKEND = 'users.mail.OutboxBackend'
+
+# SMTP-сервер, через который воркер отправляет очередь; без него письма
+# складываются файлами в sent_emails
+EMAIL_HOST = os.getenv('YATUBE_EMAIL_HOST', '')
+EMAIL_PORT = int(os.getenv('YATUBE_EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.getenv('YATUBE_EMAIL_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('YATUBE_EMAIL_PASSWORD', '')
+
+MAIL_DELIVERY_BACKEND = (
+    'django.core.mail.backends.smtp.EmailBackend' if EMAIL_HOST
+    else 'django.core.mail.backends.filebased.EmailBackend'
+)
 
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Отправлять очередь фоновым потоком веб-процесса; 0 — только командой
+# send_queued_mail
+MAIL_WORKER = os.getenv('YATUBE_MAIL_WORKER', '1') == '1'
+
+# Писем в одной пачке отправки
+MAIL_BATCH_SIZE = 50
+
+# Раз в сколько секунд фоновый поток проверяет очередь без новых писем
+MAIL_POLL_INTERVAL = 30
+
+# После стольких неудачных попыток письмо остаётся в очереди неотправленным
+MAIL_MAX_ATTEMPTS = 5
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Число фоновых потоков, создающих миниатюры загруженных картинок;
+# 0 — миниатюры создаёт только команда warm_thumbnails, до этого
+# показывается оригинал
+THUMBNAIL_WORKERS = int(os.getenv('YATUBE_THUMBNAIL_WORKERS', 2))
+
+# Число фоновых потоков, пересчитывающих рекомендации авторов после
+# подписок и при промахе кеша; 0 — рекомендации считает только
+# команда compute_suggestions, до её запуска показываются прежние
+SUGGESTION_WORKERS = int(os.getenv('YATUBE_SUGGESTION_WORKERS', 1))
+
+# Размер пачки отложенной записи комментариев (write-behind);
+# 0 — каждый комментарий сохраняется сразу
+COMMENT_BATCH_SIZE = int(os.getenv('YATUBE_COMMENT_BATCH_SIZE', 0))
+
+# Через сколько секунд неполная пачка комментариев всё равно пишется
+COMMENT_FLUSH_INTERVAL = 1.0
+
+# Токен для чтения /metrics/ (заголовок Authorization: Bearer <токен>);
+# без токена метрики видит только персонал
+METRICS_TOKEN = os.getenv('YATUBE_METRICS_TOKEN', '')
+
+# Живое обновление лент (SSE): пауза перед переподключением клиента
+# и интервал комментариев-пингов в секундах
+LIVE_RETRY = 5
+LIVE_KEEPALIVE = 15
+# Сколько пропущенных постов получает переподключившийся клиент
+LIVE_BACKLOG = 50
+
+# Потоков ASGI-приложения, в которых выполняются обычные запросы Django
+ASGI_THREADS = int(os.getenv('YATUBE_ASGI_THREADS', 16))
+
 # Количество постов на странице Paginator
 POSTS_OF_PAGE = 10
 
+# Записей на странице списков API по умолчанию и наибольшее (?limit=)
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Корневых комментариев на одной подгружаемой странице
+COMMENTS_OF_PAGE = 20
+
+# Ответов ветки, показываемых под корнем сразу и подгружаемых за раз
+REPLIES_OF_THREAD = 10
+
+# Максимальная длина материализованной ленты подписок
+TIMELINE_MAX_LENGTH = 800
+
+# С этого числа подписчиков посты автора не раскладываются по лентам,
+# а подмешиваются в ленту при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Сколько самых релевантных постов ранжирует поиск
+SEARCH_MAX_RESULTS = 1000
+
 # кеширование фалов
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.LocalCache',
     }
 }
+
+# Общий кеш для нескольких воркеров: адрес redis://... (нужен пакет
+# django-redis) или путь к каталогу файлового кеша как его локальная замена.
+# Перед общим кешем работает короткоживущий кеш процесса.
+SHARED_CACHE = os.getenv('YATUBE_SHARED_CACHE', '')
+
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TwoTierCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {
+                'L1_TIMEOUT': int(os.getenv('YATUBE_L1_CACHE_TIMEOUT', 5)),
+            },
+        },
+        'shared': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': SHARED_CACHE,
+        } if SHARED_CACHE.startswith('redis://') else {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': SHARED_CACHE,
+        },
+    }